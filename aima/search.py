@@ -5,7 +5,7 @@ then create problem instances and solve them with calls to the various search
 functions."""
 
 from utils import *
-import math, random, sys, time, bisect, string
+import math, random, sys, time, bisect, string, json
 
 #______________________________________________________________________________
 
@@ -52,6 +52,15 @@ class Problem(object):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
         abstract
+
+    def key(self, state):
+        """Return a compact encoding of state. The graph searches store these
+        keys rather than the states in their explored sets, so a problem with
+        bulky states can keep a much smaller record of where it has been. The
+        explored sets look states up by hash(state) first, and only compute
+        and compare keys on a hash match. The default method returns the
+        state itself."""
+        return state
 #______________________________________________________________________________
 
 class Node:
@@ -110,6 +119,73 @@ class Node:
 
 #______________________________________________________________________________
 
+class Deadline:
+    """A wall-clock time limit for a search, passed as its deadline argument.
+    The clock starts when the first search is given the deadline, so one
+    Deadline shared by nested searches (iterative deepening, A*, ...) bounds
+    them all. The searches call check on every node they expand; once the
+    time is up they stop and return the best node seen so far in place of a
+    solution, along with their explored count as usual.
+    The best node is the one with the highest score(node). The score is, in
+    order of preference, the function given here, the objective of the
+    search itself (the lowest f for the best-first searches), the value of
+    the problem if it defines one, and otherwise the last node is kept.
+    Afterwards, expired tells whether the search timed out, best and
+    best_score give the best node and its score, and explored the last
+    count reported. If given, progress(deadline, explored) is called at
+    most once every interval seconds while the search runs."""
+
+    def __init__(self, seconds, progress=None, interval=1.0, score=None):
+        update(self, seconds=seconds, progress=progress, interval=interval,
+               score=score, start=None, limit=None, report=None,
+               expired=False, best=None, best_score=None, explored=0)
+
+    def begin(self, problem=None, score=None):
+        """Start the clock, unless an enclosing search has already started it.
+        A search passes its own objective as score, if it has one. Without a
+        score nor a problem, the nodes are not scored."""
+        if self.start is not None:
+            return
+        self.start = clock()
+        self.limit = self.start + self.seconds
+        self.report = self.start + self.interval
+        if self.score is None:
+            self.score = score
+        if self.score is None and problem is not None and has_value(problem):
+            self.score = lambda node: problem.value(node.state)
+
+    def elapsed(self):
+        "Seconds since the clock started."
+        return clock() - self.start
+
+    def check(self, node, explored):
+        """Record node (if not None) as a candidate for best and explored as
+        the current count, and return True if the time is up."""
+        if node is not None:
+            if self.score is None:
+                self.best = node
+            else:
+                score = self.score(node)
+                if self.best is None or score > self.best_score:
+                    self.best, self.best_score = node, score
+        self.explored = explored
+        now = clock()
+        if self.progress is not None and now >= self.report:
+            self.report = now + self.interval
+            self.progress(self, explored)
+        if now >= self.limit:
+            self.expired = True
+        return self.expired
+
+def has_value(problem):
+    "Does the problem (or the one an InstrumentedProblem wraps) define value?"
+    while isinstance(problem, InstrumentedProblem):
+        problem = problem.problem
+    value = getattr(type(problem), 'value', None)
+    return value is not None and getattr(value, 'im_func', value) is not Problem.value.im_func
+
+#______________________________________________________________________________
+
 class SimpleProblemSolvingAgentProgram:
     """Abstract framework for a problem-solving agent. [Fig. 3.1]"""
     def __init__(self, initial_state=None):
@@ -139,28 +215,50 @@ class SimpleProblemSolvingAgentProgram:
 #______________________________________________________________________________
 # Uninformed Search algorithms
 
-def tree_search(problem, frontier):
+def tree_search(problem, frontier, deadline=None):
     """Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
-    Don't worry about repeated paths to a state. [Fig. 3.7]"""
+    Don't worry about repeated paths to a state. [Fig. 3.7]
+    The argument deadline is an optional Deadline, as in every search
+    below; the count given to it is the number of nodes expanded."""
     frontier.append(Node(problem.initial))
+    observe = getattr(problem, 'observe', None)
+    if deadline: deadline.begin(problem)
+    expanded = 0
     while frontier:
+        if observe: observe(frontier, None)
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node
+        if deadline and deadline.check(node, expanded):
+            return deadline.best
+        expanded += 1
         frontier.extend(node.expand(problem))
     return None
 
-def graph_search(problem, frontier, bound):
+def graph_search(problem, frontier, bound, explored=None, deadline=None):
     """Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
-    If two paths reach a state, only use the first one. [Fig. 3.7]"""
+    If two paths reach a state, only use the first one. [Fig. 3.7]
+    The argument explored may be an empty BloomFilter to cap memory, in
+    which case explored.probabilistic is True and a failure is not conclusive:
+    a state may have been skipped because of a false positive. The returned
+    node carries no mark of this, so when explored.probabilistic is set, a
+    None result must not be taken as proof that no goal is reachable, nor a
+    goal as the shallowest or cheapest one; explored.pruned counts the
+    states skipped as already explored. The argument deadline is an optional Deadline."""
     frontier.append(Node(problem.initial))
-    explored = set()
+    if explored is None:
+        explored = ExploredSet(problem.key)
+    observe = getattr(problem, 'observe', None)
+    if deadline: deadline.begin(problem)
     while frontier:
+        if observe: observe(frontier, explored)
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node, len(explored)
+        if deadline and deadline.check(node, len(explored)):
+            return deadline.best, len(explored)
         explored.add(node.state)
         if len(explored) > bound:
             return None, len(explored)
@@ -169,28 +267,33 @@ def graph_search(problem, frontier, bound):
                         and child not in frontier)
     return None, len(explored)
 
-def breadth_first_tree_search(problem):
+def breadth_first_tree_search(problem, deadline=None):
     "Search the shallowest nodes in the search tree first."
-    return tree_search(problem, FIFOQueue())
+    return tree_search(problem, FIFOQueue(), deadline)
 
-def depth_first_tree_search(problem):
+def depth_first_tree_search(problem, deadline=None):
     "Search the deepest nodes in the search tree first."
-    return tree_search(problem, Stack())
+    return tree_search(problem, Stack(), deadline)
 
-def depth_first_graph_search(problem, bound):
+def depth_first_graph_search(problem, bound, explored=None, deadline=None):
     "Search the deepest nodes in the search tree first."
-    return graph_search(problem, Stack(), bound)
+    return graph_search(problem, Stack(), bound, explored, deadline)
 
-def breadth_first_search(problem):
+def breadth_first_search(problem, deadline=None):
     "[Fig. 3.11]"
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
     frontier = FIFOQueue()
     frontier.append(node)
-    explored = set()
+    explored = ExploredSet(problem.key)
+    observe = getattr(problem, 'observe', None)
+    if deadline: deadline.begin(problem)
     while frontier:
+        if observe: observe(frontier, explored)
         node = frontier.pop()
+        if deadline and deadline.check(node, len(explored)):
+            return deadline.best
         explored.add(node.state)
         for child in node.expand(problem):
             if child.state not in explored and child not in frontier:
@@ -199,29 +302,46 @@ def breadth_first_search(problem):
                 frontier.append(child)
     return None
 
-def best_first_graph_search(problem, f, bound):
+def best_first_graph_search(problem, f, bound, explored=None, deadline=None):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
     There is a subtlety: the line "f = memoize(f, 'f')" means that the f
     values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned."""
+    a best first search you can examine the f values of the path returned.
+    If f has a batch attribute, f.batch(children) is called once on the
+    children of each expanded node and must return their f values in order,
+    which lets a vectorized heuristic score them all in a single call.
+    The arguments explored and deadline are used as in graph_search; in
+    particular, a None result is unreliable when explored.probabilistic is
+    set, and a goal found may not be the one with the lowest f."""
+    batch = getattr(f, 'batch', None)
     f = memoize(f, 'f')
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node, 1
     frontier = PriorityQueue(min, f)
     frontier.append(node)
-    explored = set()
+    if explored is None:
+        explored = ExploredSet(problem.key)
+    observe = getattr(problem, 'observe', None)
+    if deadline: deadline.begin(problem, lambda node: -f(node))
     while frontier:
+        if observe: observe(frontier, explored)
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node, len(explored)
+        if deadline and deadline.check(node, len(explored)):
+            return deadline.best, len(explored)
         explored.add(node.state)
         if len(explored) > bound:
             return None, len(explored)
-        for child in node.expand(problem):
+        children = node.expand(problem)
+        if batch is not None and children:
+            for child, value in zip(children, batch(children)):
+                child.f = value
+        for child in children:
             if child.state not in explored and child not in frontier:
                 frontier.append(child)
             elif child in frontier:
@@ -231,18 +351,23 @@ def best_first_graph_search(problem, f, bound):
                     frontier.append(child)
     return None, len(explored)
 
-def uniform_cost_search(problem, bound):
+def uniform_cost_search(problem, bound, deadline=None):
     "[Fig. 3.14]"
-    return best_first_graph_search(problem, lambda node: node.path_cost, bound)
+    return best_first_graph_search(problem, lambda node: node.path_cost, bound,
+                                   deadline=deadline)
 
-def depth_limited_search(problem, limit=50):
+def depth_limited_search(problem, limit=50, deadline=None):
     "[Fig. 3.17]"
+    expanded = [0]
     def recursive_dls(node, problem, limit):
         if problem.goal_test(node.state):
             return node
         elif node.depth == limit:
             return 'cutoff'
+        elif deadline and deadline.check(node, expanded[0]):
+            return 'timeout'
         else:
+            expanded[0] += 1
             cutoff_occurred = False
             for child in node.expand(problem):
                 result = recursive_dls(child, problem, limit)
@@ -253,12 +378,16 @@ def depth_limited_search(problem, limit=50):
             return if_(cutoff_occurred, 'cutoff', None)
 
     # Body of depth_limited_search:
-    return recursive_dls(Node(problem.initial), problem, limit)
+    if deadline: deadline.begin(problem)
+    result = recursive_dls(Node(problem.initial), problem, limit)
+    if result == 'timeout':
+        return deadline.best
+    return result
 
-def iterative_deepening_search(problem):
+def iterative_deepening_search(problem, deadline=None):
     "[Fig. 3.18]"
     for depth in xrange(sys.maxint):
-        result = depth_limited_search(problem, depth)
+        result = depth_limited_search(problem, depth, deadline)
         if result != 'cutoff':
             return result
 
@@ -268,23 +397,71 @@ def iterative_deepening_search(problem):
 greedy_best_first_graph_search = best_first_graph_search
     # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
-def astar_search(problem, bound, h=None):
+def astar_search(problem, bound, h=None, explored=None, deadline=None):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), bound)
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), bound,
+                                   explored, deadline)
+
+def iterative_deepening_astar_search(problem, bound, h=None, size=1 << 16,
+                                     deadline=None):
+    """IDA* search: a series of depth-first searches that prune the nodes
+    whose f(n) = g(n)+h(n) exceeds a threshold, starting from h(initial) and
+    raised each time to the smallest f that was pruned. A TranspositionTable
+    of size slots skips a state already reached during the same iteration at
+    a path cost no greater, which keeps memory fixed whatever the depth.
+    Gives up once more than bound nodes have been expanded."""
+    h = memoize(h or problem.h, 'h')
+    table = TranspositionTable(size, problem.key)
+    explored = [0]
+
+    def search(node, threshold, iteration):
+        f = node.path_cost + h(node)
+        if f > threshold:
+            return None, f
+        if problem.goal_test(node.state):
+            return node, f
+        if table.visited(node.state, node.path_cost, iteration):
+            return None, infinity
+        if deadline and deadline.check(node, explored[0]):
+            return None, None
+        explored[0] += 1
+        if explored[0] > bound:
+            return None, None
+        smallest = infinity
+        for child in node.expand(problem):
+            result, t = search(child, threshold, iteration)
+            if result is not None or t is None:
+                return result, t
+            smallest = min(smallest, t)
+        return None, smallest
+
+    if deadline: deadline.begin(problem, lambda node: -(node.path_cost + h(node)))
+    node = Node(problem.initial)
+    threshold = h(node)
+    for iteration in xrange(sys.maxint):
+        result, threshold = search(node, threshold, iteration)
+        if deadline and deadline.expired:
+            return deadline.best, explored[0]
+        if result is not None or threshold in (None, infinity):
+            return result, explored[0]
 
 #______________________________________________________________________________
 # Other search algorithms
 
-def recursive_best_first_search(problem, h=None):
+def recursive_best_first_search(problem, h=None, deadline=None):
     "[Fig. 3.26]"
     h = memoize(h or problem.h, 'h')
+    expanded = [0]
 
     def RBFS(problem, node, flimit):
         if problem.goal_test(node.state):
             return node, 0   # (The second value is immaterial)
+        if deadline and deadline.check(node, expanded[0]):
+            return None, None
+        expanded[0] += 1
         successors = node.expand(problem)
         if len(successors) == 0:
             return None, infinity
@@ -300,20 +477,54 @@ def recursive_best_first_search(problem, h=None):
             else:
                 alternative = infinity
             result, best.f = RBFS(problem, best, min(flimit, alternative))
-            if result is not None:
+            if result is not None or best.f is None:
                 return result, best.f
 
+    if deadline: deadline.begin(problem, lambda node: -(node.path_cost + h(node)))
     node = Node(problem.initial)
     node.f = h(node)
     result, bestf = RBFS(problem, node, infinity)
+    if deadline and deadline.expired:
+        return deadline.best
     return result
 
-def hill_climbing(problem):
+def hill_climbing(problem, deadline=None):
     """From the initial node, keep choosing the neighbor with highest value,
-    stopping when no neighbor is better. [Fig. 4.2]"""
+    stopping when no neighbor is better. [Fig. 4.2]
+    If the problem has a delta method, problem.delta(state, action) must
+    return value(result(state, action)) - value(state); the actions are then
+    scored without building the neighbors, only the best one is expanded, and
+    the number of moves evaluated is returned in place of the explored set
+    size. On a deadline, the current state is returned: it is the best one.
+    As a single step may score tens of thousands of actions, the deadline is
+    also checked every 1024 actions in the delta case; when it expires
+    mid-step, the best action found so far is still taken if it improves."""
     current = Node(problem.initial)
-    explored = set()
-    while True:
+    delta = getattr(problem, 'delta', None)
+    if deadline: deadline.begin(problem)
+    if delta is not None:
+        evaluated = 0
+        while not (deadline and deadline.check(current, evaluated)):
+            # argmax with ties broken at random, one action at a time
+            best, best_delta, ties = None, None, 0
+            for action in problem.actions(current.state):
+                evaluated += 1
+                d = delta(current.state, action)
+                if best is None or d > best_delta:
+                    best, best_delta, ties = action, d, 1
+                elif d == best_delta:
+                    ties += 1
+                    if random.randrange(ties) == 0:
+                        best = action
+                if (deadline and evaluated % 1024 == 0
+                        and deadline.check(current, evaluated)):
+                    break
+            if best is None or best_delta <= 0:
+                break
+            current = current.child_node(problem, best)
+        return current.state, evaluated
+    explored = ExploredSet(problem.key)
+    while not (deadline and deadline.check(current, len(explored))):
         neighbors = current.expand(problem)
         explored.update(node.state for node in neighbors)
         if not neighbors:
@@ -325,14 +536,48 @@ def hill_climbing(problem):
         current = neighbor
     return current.state, len(explored)
 
+def first_choice_hill_climbing(problem, bound=1000, deadline=None):
+    """Stochastic hill climbing that draws the neighbors of the current state
+    at random, one at a time, and moves to the first one that is better,
+    stopping at a goal or after bound consecutive draws without an
+    improvement. [Sec. 4.1.1]
+    The problem must have a random_action(state) method, which returns None
+    when there is no action; problem.delta is used when it exists, as in
+    hill_climbing. Return the final state and the number of moves drawn."""
+    current = Node(problem.initial)
+    delta = getattr(problem, 'delta', None)
+    if deadline: deadline.begin(problem)
+    sampled = failures = 0
+    while failures < bound and not problem.goal_test(current.state):
+        if deadline and deadline.check(current, sampled):
+            break
+        action = problem.random_action(current.state)
+        if action is None:
+            break
+        sampled += 1
+        if delta is not None:
+            improved = delta(current.state, action) > 0
+            neighbor = improved and current.child_node(problem, action)
+        else:
+            neighbor = current.child_node(problem, action)
+            improved = problem.value(neighbor.state) > problem.value(current.state)
+        if improved:
+            current, failures = neighbor, 0
+        else:
+            failures += 1
+    return current.state, sampled
+
 def exp_schedule(k=20, lam=0.005, limit=100):
     "One possible schedule function for simulated annealing"
     return lambda t: if_(t < limit, k * math.exp(-lam * t), 0)
 
-def simulated_annealing(problem, schedule=exp_schedule()):
+def simulated_annealing(problem, schedule=exp_schedule(), deadline=None):
     "[Fig. 4.5]"
     current = Node(problem.initial)
+    if deadline: deadline.begin(problem)
     for t in xrange(sys.maxint):
+        if deadline and deadline.check(current, t):
+            return deadline.best
         T = schedule(t)
         if T == 0:
             return current
@@ -359,21 +604,26 @@ def lrta_star_agent(s1):
 #______________________________________________________________________________
 # Genetic Algorithm
 
-def genetic_search(problem, fitness_fn, ngen=1000, pmut=0.1, n=20):
+def genetic_search(problem, fitness_fn, ngen=1000, pmut=0.1, n=20, deadline=None):
     """Call genetic_algorithm on the appropriate parts of a problem.
     This requires the problem to have states that can mate and mutate,
     plus a value method that scores states."""
     s = problem.initial_state
     states = [problem.result(s, a) for a in problem.actions(s)]
     random.shuffle(states)
-    return genetic_algorithm(states[:n], problem.value, ngen, pmut)
+    return genetic_algorithm(states[:n], problem.value, ngen, pmut, deadline)
 
-def genetic_algorithm(population, fitness_fn, ngen=1000, pmut=0.1):
-    "[Fig. 4.8]"
+def genetic_algorithm(population, fitness_fn, ngen=1000, pmut=0.1, deadline=None):
+    """[Fig. 4.8]
+    On a deadline, the fittest individual of the current generation is
+    returned."""
+    if deadline: deadline.begin()
     for i in range(ngen):
+        if deadline and deadline.check(None, i * len(population)):
+            break
         new_population = []
-        for i in len(population):
-            fitnesses = map(fitness_fn, population)
+        fitnesses = map(fitness_fn, population)
+        for j in range(len(population)):
             p1, p2 = weighted_sample_with_replacement(population, fitnesses, 2)
             child = p1.mate(p2)
             if random.uniform(0, 1) < pmut:
@@ -772,36 +1022,129 @@ def mutate_boggle(board):
 # Code to compare searchers on various problems.
 
 class InstrumentedProblem(Problem):
-    """Delegates to a problem, and keeps statistics."""
+    """Delegates to a problem, and keeps statistics.
+    Besides the counts of successors, goal tests and states, it records the
+    number of calls and the cumulative time spent in each method of the
+    problem, including those it does not define itself (delta, h, ...), and
+    in any function wrapped with timed (such as a heuristic). It also keeps a
+    histogram of the branching factor by depth, and the peak frontier and
+    explored sizes reported by the searches through observe. stats() exports
+    everything as a dict, and json() as a JSON string."""
 
     def __init__(self, problem):
         self.problem = problem
         self.succs = self.goal_tests = self.states = 0
         self.found = None
+        self.calls = {}
+        self.times = {}
+        # depths of the generated states not yet expanded, by key, and the
+        # state being expanded with its depth
+        self.depths = {problem.key(problem.initial): 0}
+        self.expanding = None
+        self.branching = {}
+        self.peak_frontier = self.peak_explored = 0
+
+    def _record(self, name, start):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + clock() - start
+
+    def timed(self, fn, name=None):
+        """Wrap fn so that its calls are recorded under name (by default its
+        own name), along with those of its batch variant if it has one."""
+        name = name or fn.__name__
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._record(name, start)
+        wrapper.__name__ = fn.__name__
+        if hasattr(fn, 'batch'):
+            wrapper.batch = self.timed(fn.batch, name + '.batch')
+        return wrapper
 
     def actions(self, state):
         self.succs += 1
-        return self.problem.actions(state)
+        start = clock()
+        actions = list(self.problem.actions(state))
+        self._record('actions', start)
+        depth = self.depths.pop(self.problem.key(state), None)
+        if depth is None and self.expanding and self.expanding[0] is state:
+            depth = self.expanding[1]
+        self.expanding = (state, depth)
+        histogram = self.branching.setdefault(depth, {})
+        histogram[len(actions)] = histogram.get(len(actions), 0) + 1
+        return actions
 
     def result(self, state, action):
         self.states += 1
-        return self.problem.result(state, action)
+        start = clock()
+        result = self.problem.result(state, action)
+        self._record('result', start)
+        if self.expanding and self.expanding[0] is state:
+            depth = self.expanding[1]
+        else:
+            depth = self.depths.get(self.problem.key(state))
+        if depth is not None:
+            self.depths.setdefault(self.problem.key(result), depth + 1)
+        return result
 
     def goal_test(self, state):
         self.goal_tests += 1
+        start = clock()
         result = self.problem.goal_test(state)
+        self._record('goal_test', start)
         if result:
             self.found = state
         return result
 
     def path_cost(self, c, state1, action, state2):
-        return self.problem.path_cost(c, state1, action, state2)
+        start = clock()
+        cost = self.problem.path_cost(c, state1, action, state2)
+        self._record('path_cost', start)
+        return cost
 
     def value(self, state):
-        return self.problem.value(state)
+        start = clock()
+        value = self.problem.value(state)
+        self._record('value', start)
+        return value
+
+    def key(self, state):
+        start = clock()
+        key = self.problem.key(state)
+        self._record('key', start)
+        return key
+
+    def observe(self, frontier, explored):
+        "Called by the searches with their frontier and explored set."
+        self.peak_frontier = max(self.peak_frontier, len(frontier))
+        if explored is not None:
+            self.peak_explored = max(self.peak_explored, len(explored))
+
+    def stats(self):
+        """Return the statistics as a dict: counts, peak sizes, and for each
+        method its calls, total and per-call time in seconds, and the
+        branching histogram as {depth: {branching factor: count}}."""
+        return {'succs': self.succs, 'goal_tests': self.goal_tests,
+                'states': self.states,
+                'peak_frontier': self.peak_frontier,
+                'peak_explored': self.peak_explored,
+                'methods': dict((name, {'calls': self.calls[name],
+                                        'time': self.times[name],
+                                        'per_call': self.times[name] / self.calls[name]})
+                                for name in self.calls),
+                'branching': self.branching}
+
+    def json(self):
+        "Return stats() as a compact JSON string, e.g. for a CSV column."
+        return json.dumps(self.stats(), sort_keys=True, separators=(',', ':'))
 
     def __getattr__(self, attr):
-        return getattr(self.problem, attr)
+        value = getattr(self.problem, attr)
+        if callable(value) and not attr.startswith('_'):
+            return self.timed(value, attr)
+        return value
 
     def __repr__(self):
         return '<%4d/%4d/%4d/%s>' % (self.succs, self.goal_tests,
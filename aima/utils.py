@@ -5,6 +5,9 @@
 from __future__ import generators
 import operator, math, random, copy, sys, os.path, bisect, re
 
+# the most precise clock of the platform, not monotonic
+from timeit import default_timer as clock
+
 assert (2,5) <= sys.version_info < (3,), """\
 This code is meant for Python 2.5 through 2.7.
 You might find that the parts you care about still work in older
@@ -694,8 +697,12 @@ class Queue:
         q.pop()         -- return the top item from the queue
         len(q)          -- number of items in q (also q.__len())
         item in q       -- does q contain item?
-    Note that isinstance(Stack(), Queue) is false, because we implement stacks
-    as lists.  If Python ever gets interfaces, Queue will be an interface."""
+    Stack and FIFOQueue keep a dict counting the queued items next to their
+    list, so that membership is a hash lookup rather than a linear scan; as
+    nodes hash and compare by state, this amounts to a set of queued states.
+    The dict is only built on the first membership test, so a queue that is
+    never searched (as in tree_search) may hold unhashable items.
+    PriorityQueue keeps a similar index into its heap."""
 
     def __init__(self):
         abstract
@@ -703,57 +710,280 @@ class Queue:
     def extend(self, items):
         for item in items: self.append(item)
 
-def Stack():
-    """Return an empty list, suitable as a Last-In-First-Out Queue."""
-    return []
+    def __contains__(self, item):
+        if self.members is None:
+            self.members = {}
+            for e in self._items():
+                self._remember(e)
+        return item in self.members
+
+    def _remember(self, item):
+        if self.members is not None:
+            self.members[item] = self.members.get(item, 0) + 1
+
+    def _forget(self, item):
+        if self.members is None:
+            return
+        count = self.members[item]
+        if count == 1:
+            del self.members[item]
+        else:
+            self.members[item] = count - 1
+
+class Stack(Queue):
+    """A Last-In-First-Out Queue."""
+    def __init__(self):
+        self.A = []; self.members = None
+    def _items(self):
+        return self.A
+    def append(self, item):
+        self.A.append(item)
+        self._remember(item)
+    def __len__(self):
+        return len(self.A)
+    def pop(self):
+        e = self.A.pop()
+        self._forget(e)
+        return e
 
 class FIFOQueue(Queue):
     """A First-In-First-Out Queue."""
     def __init__(self):
-        self.A = []; self.start = 0
+        self.A = []; self.start = 0; self.members = None
+    def _items(self):
+        return self.A[self.start:]
     def append(self, item):
         self.A.append(item)
+        self._remember(item)
     def __len__(self):
         return len(self.A) - self.start
-    def extend(self, items):
-        self.A.extend(items)
     def pop(self):
         e = self.A[self.start]
         self.start += 1
         if self.start > 5 and self.start > len(self.A)/2:
             self.A = self.A[self.start:]
             self.start = 0
+        self._forget(e)
         return e
-    def __contains__(self, item):
-        return item in self.A[self.start:]
 
 class PriorityQueue(Queue):
     """A queue in which the minimum (or maximum) element (as determined by f and
     order) is returned first. If order is min, the item with minimum f(x) is
     returned first; if order is max, then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+
+    Items are kept in a binary heap of [priority, count, item] entries, with a
+    dict index from each item to its slot in the heap, so membership and lookup
+    are O(1) while append, pop and decrease-key are O(log n). The insertion
+    count breaks ties first-in, first-out when order is min, and last-in,
+    first-out when order is max, so that a max queue pops in exactly the
+    reverse order of a min queue, as it always has. Appending an item that is already
+    queued keeps whichever copy has the better priority, moving the entry up
+    in place (decrease-key). Deleted entries are only marked, and are skipped
+    when they reach the top of the heap."""
     def __init__(self, order=min, f=lambda x: x):
-        update(self, A=[], order=order, f=f)
+        update(self, A=[], index={}, count=0, removed=0, order=order, f=f)
     def append(self, item):
-        bisect.insort(self.A, (self.f(item), item))
+        priority = self.f(item)
+        if self.order != min:
+            priority = -priority
+        i = self.index.get(item)
+        if i is not None:
+            entry = self.A[i]
+            if priority < entry[0]:
+                entry[0], entry[2] = priority, item
+                self._sift_up(i)
+            return
+        self.count += 1
+        count = self.count if self.order == min else -self.count
+        self.A.append([priority, count, item])
+        self._sift_up(len(self.A) - 1)
     def __len__(self):
-        return len(self.A)
+        return len(self.index)
     def pop(self):
-        if self.order == min:
-            return self.A.pop(0)[1]
-        else:
-            return self.A.pop()[1]
+        A = self.A
+        while A:
+            entry = A.pop()
+            if A:
+                entry, A[0] = A[0], entry
+                self._sift_down(0)
+            if entry[2] is _removed:
+                self.removed -= 1
+            else:
+                del self.index[entry[2]]
+                return entry[2]
+        raise IndexError('pop from empty priority queue')
     def __contains__(self, item):
-        return some(lambda (_, x): x == item, self.A)
+        return item in self.index
     def __getitem__(self, key):
-        for _, item in self.A:
-            if item == key:
-                return item
+        i = self.index.get(key)
+        if i is not None:
+            return self.A[i][2]
     def __delitem__(self, key):
-        for i, (value, item) in enumerate(self.A):
-            if item == key:
-                self.A.pop(i)
-                return
+        i = self.index.pop(key, None)
+        if i is not None:
+            self.A[i][2] = _removed
+            self.removed += 1
+            if self.removed > len(self.index):
+                self._compact()
+    def _compact(self):
+        "Drop the entries marked as removed and rebuild the heap."
+        self.A = [entry for entry in self.A if entry[2] is not _removed]
+        self.removed = 0
+        self.A.sort()
+        for i, entry in enumerate(self.A):
+            self.index[entry[2]] = i
+    def _sift_up(self, i):
+        A, index = self.A, self.index
+        entry = A[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            above = A[parent]
+            if not entry < above:
+                break
+            A[i] = above
+            if above[2] is not _removed: index[above[2]] = i
+            i = parent
+        A[i] = entry
+        if entry[2] is not _removed: index[entry[2]] = i
+    def _sift_down(self, i):
+        A, index = self.A, self.index
+        n = len(A)
+        entry = A[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and A[child + 1] < A[child]:
+                child += 1
+            below = A[child]
+            if not below < entry:
+                break
+            A[i] = below
+            if below[2] is not _removed: index[below[2]] = i
+            i = child
+        A[i] = entry
+        if entry[2] is not _removed: index[entry[2]] = i
+
+_removed = object() ## Marks the heap entries of deleted items
+
+class ExploredSet(object):
+    """A set of states that stores key(state) instead of the state itself.
+    Entries are filed under hash(state), and key(state) is only computed and
+    compared when a state's hash is already present, so a state that carries
+    a precomputed hash (e.g. a Zobrist hash) is tested in O(1) and full
+    equality only comes in on a hash match."""
+    probabilistic = False
+    def __init__(self, key=lambda x: x):
+        update(self, key=key, buckets={}, size=0)
+    def add(self, state):
+        h = hash(state)
+        bucket = self.buckets.get(h)
+        if bucket is None:
+            self.buckets[h] = self.key(state)
+            self.size += 1
+            return
+        key = self.key(state)
+        if isinstance(bucket, _Collisions):
+            if key not in bucket:
+                bucket.append(key)
+                self.size += 1
+        elif bucket != key:
+            self.buckets[h] = _Collisions([bucket, key])
+            self.size += 1
+    def update(self, states):
+        for state in states: self.add(state)
+    def __contains__(self, state):
+        bucket = self.buckets.get(hash(state))
+        if bucket is None:
+            return False
+        key = self.key(state)
+        if isinstance(bucket, _Collisions):
+            return key in bucket
+        return bucket == key
+    def __len__(self):
+        return self.size
+
+class _Collisions(list):
+    "Keys of distinct states sharing a hash in an ExploredSet."
+
+class BloomFilter(object):
+    """A drop-in replacement for ExploredSet whose memory is fixed up front: a
+    Bloom filter of the bits needed to hold capacity states with the given
+    false-positive rate. A state is never stored, only hash(state), so
+    membership tests may wrongly answer True (never wrongly False) and a
+    search using it may skip a state it has not seen. pruned counts the
+    positive answers, any of which may be one of these false positives, at
+    an estimated rate of false_positive_rate().
+    len() counts the states added that were not already reported present,
+    which may fall short of the true count once the filter fills up.
+    >>> b = BloomFilter(100, 0.01)
+    >>> b.add('a'); 'a' in b, len(b)
+    (True, 1)
+    """
+    probabilistic = True
+    def __init__(self, capacity, rate=1e-6):
+        bits = max(int(math.ceil(-capacity * math.log(rate) / math.log(2) ** 2)), 8)
+        update(self, capacity=capacity, rate=rate, bits=bits,
+               hashes=max(int(round(float(bits) / capacity * math.log(2))), 1),
+               array=bytearray((bits + 7) // 8), set_bits=0, size=0, pruned=0)
+    def _positions(self, state):
+        # double hashing: the k positions come from two halves of a mixed
+        # 64-bit hash, the second forced odd
+        x = (hash(state) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = x >> 32, (x & 0xFFFFFFFF) | 1
+        return [(h1 + i * h2) % self.bits for i in xrange(self.hashes)]
+    def add(self, state):
+        array, new = self.array, False
+        for b in self._positions(state):
+            byte, bit = b >> 3, 1 << (b & 7)
+            if not array[byte] & bit:
+                array[byte] |= bit
+                self.set_bits += 1
+                new = True
+        if new:
+            self.size += 1
+    def update(self, states):
+        for state in states: self.add(state)
+    def __contains__(self, state):
+        array = self.array
+        for b in self._positions(state):
+            if not array[b >> 3] & (1 << (b & 7)):
+                return False
+        self.pruned += 1
+        return True
+    def __len__(self):
+        return self.size
+    def fill_ratio(self):
+        "Fraction of the bits that are set."
+        return float(self.set_bits) / self.bits
+    def false_positive_rate(self):
+        "Estimated probability that a state not added is reported present."
+        return self.fill_ratio() ** self.hashes
+
+class TranspositionTable(object):
+    """A fixed-size table of the states reached by an iterative deepening
+    search. A state is filed in slot hash(state) % size along with its key,
+    the iteration and the path cost at which it was reached; a new entry
+    simply replaces whatever occupied its slot, so memory never grows."""
+    def __init__(self, size, key=lambda x: x):
+        update(self, size=size, key=key, slots=[None] * size, filled=0)
+    def visited(self, state, cost, iteration):
+        """Return True if state was already reached during this iteration at
+        a path cost no greater than cost, else record it and return False."""
+        h = hash(state)
+        i = h % self.size
+        entry = self.slots[i]
+        key = self.key(state)
+        if entry is None:
+            self.filled += 1
+        elif (entry[0] == h and entry[2] == iteration and entry[3] <= cost
+              and entry[1] == key):
+            return True
+        self.slots[i] = (h, key, iteration, cost)
+        return False
+    def __len__(self):
+        return self.filled
 
 ## Fig: The idea is we can define things like Fig[3,10] later.
 ## Alas, it is Fig[3,10] not Fig[3.10], because that would be the same
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recuit simulé dédié au FilledSudoku.
+
+Plutôt que de développer tous les voisins de l'état courant comme
+aima.search.simulated_annealing, chaque itération tire une seule permutation
+de deux cases initialement vides d'un même carré et l'évalue en temps constant
+à partir des comptes de chiffres par ligne et par colonne. La grille et les
+comptes sont modifiés en place lorsque la permutation est acceptée.
+
+La température initiale est calibrée sur l'écart type des variations de
+conflits d'un échantillon de permutations aléatoires. Elle décroît
+géométriquement après chaque chaîne de permutations et est ramenée à sa valeur
+initiale lorsque la meilleure grille n'a pas été améliorée depuis un certain
+nombre de chaînes.
+"""
+
+from math import exp
+from random import Random
+
+from bitboard import grid
+from sudoku import apply_swap, swap_delta
+
+def calibrate(cells, counts, squares, rng, samples=200):
+    """
+    Température initiale: écart type des variations de conflits de samples
+    permutations aléatoires de la grille.
+    """
+    deltas = []
+    for n in xrange(samples):
+        p, q = rng.sample(rng.choice(squares), 2)
+        deltas.append(swap_delta(cells, counts, p, q))
+    mean = float(sum(deltas)) / len(deltas)
+    return max((sum((d - mean) ** 2 for d in deltas) / len(deltas)) ** 0.5, 1.0)
+
+def simulated_annealing(problem, iterations=1000000, alpha=0.99, chain=None,
+                        stall=50, seed=None, deadline=None):
+    """
+    Minimise les conflits de l'état initial d'un FilledSudoku par recuit
+    simulé.
+
+    La température est multipliée par alpha toutes les chain itérations (par
+    défaut, le carré du nombre de cases permutables) et réchauffée à sa valeur
+    initiale après stall chaînes sans amélioration. L'échéance deadline, s'il
+    y en a une, est vérifiée après chaque chaîne.
+
+    Retourne la meilleure grille obtenue et le nombre d'itérations effectuées.
+    """
+    rng = Random(seed)
+    if deadline: deadline.begin(problem)
+    state = grid(problem.initial)
+    cells = bytearray(state.cells)
+    counts, conflicts = problem.counts(state)
+    counts = [list(unit) for unit in counts]
+
+    squares = problem.mutable_squares()
+    if not squares or conflicts == 0:
+        return state, 0
+
+    if chain is None:
+        chain = max(sum(map(len, squares)) ** 2, 1)
+
+    initial = temperature = calibrate(cells, counts, squares, rng)
+    best, best_cells = conflicts, str(cells)
+    stalled = 0
+
+    iteration = 0
+    while iteration < iterations and best:
+        improved = False
+        for n in xrange(min(chain, iterations - iteration)):
+            iteration += 1
+            p, q = rng.sample(rng.choice(squares), 2)
+            change = swap_delta(cells, counts, p, q)
+            if change > 0 and rng.random() >= exp(-change / temperature):
+                continue
+
+            apply_swap(cells, counts, p, q)
+            conflicts += change
+
+            if conflicts < best:
+                best, best_cells = conflicts, str(cells)
+                improved = True
+                if not best:
+                    break
+
+        if deadline and deadline.check(None, iteration):
+            break
+        stalled = 0 if improved else stalled + 1
+        if stalled >= stall:
+            temperature, stalled = initial, 0
+        else:
+            temperature *= alpha
+
+    return grid(bytearray(best_cells)), iteration
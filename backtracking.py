@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recherche en profondeur dédiée au Sudoku normalisé.
+
+Plutôt que de passer par depth_first_graph_search, qui copie la grille de
+possibilités à chaque résultat et maintient un ensemble d'états explorés, la
+recherche travaille sur une seule liste de masques. Elle branche sur la case
+qui a le moins de possibilités, propage l'hypothèse et, en cas d'échec, annule
+les réductions en dépilant la piste des masques modifiés.
+"""
+
+from bitboard import DIGITS, POPCOUNT, HashedTuple, zobrist
+from propagation import CANDIDATES, MASKS, propagate, undo
+
+def most_constrained(masks):
+    """
+    Position de la case non résolue qui a le moins de possibilités, ou None si
+    toutes les cases sont résolues.
+    """
+    best, size = None, 10
+    for p, mask in enumerate(masks):
+        n = POPCOUNT[mask]
+        if 1 < n < size:
+            best, size = p, n
+            if n == 2:
+                break
+    return best
+
+def solve(masks):
+    """
+    Complète en place une liste de masques de possibilités par retour
+    arrière.
+
+    Retourne un couple (résolu, hypothèses) où hypothèses est le nombre
+    d'hypothèses essayées. Si la grille n'a pas de solution, les masques sont
+    restaurés dans leur état initial.
+    """
+    if 0 in masks:
+        return False, 0
+
+    trail = []
+    explored = [0]
+
+    def search():
+        p = most_constrained(masks)
+        if p is None:
+            return True
+        for k in DIGITS[masks[p]]:
+            explored[0] += 1
+            mark = len(trail)
+            trail.append((p, masks[p]))
+            masks[p] = 1 << (k - 1)
+            if propagate(masks, [p], trail) is not None and search():
+                return True
+            undo(masks, trail, mark)
+        return False
+
+    return search(), explored[0]
+
+def backtracking_search(problem):
+    """
+    Résout l'état initial d'un NormalizedSudoku par retour arrière.
+
+    Retourne l'état résolu (ou None) et le nombre d'hypothèses essayées, qui
+    tient lieu de nombre d'états explorés.
+    """
+    masks = [MASKS[candidates] for candidates in problem.initial]
+    solved, explored = solve(masks)
+    if not solved:
+        return None, explored
+
+    state = tuple(CANDIDATES[mask] for mask in masks)
+    return HashedTuple(state, zobrist(state)), explored
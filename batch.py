@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""
+Résolution vectorisée d'un lot de grilles.
+
+Les N grilles sont représentées par un tenseur booléen (N, 81, 9) de
+possibilités. Les singletons nus (une case n'a plus qu'une possibilité) et
+cachés (un chiffre n'a plus qu'une position dans une unité) sont éliminés pour
+toutes les grilles à la fois par des réductions NumPy sur les indices des
+unités précalculés. Seules les grilles que la propagation ne suffit pas à
+résoudre passent ensuite par une recherche grille par grille.
+"""
+
+import numpy as np
+
+from backtracking import solve
+from bitboard import DIGITS
+from utils import CELL_UNITS, UNIT_CELLS
+
+# cases des lignes, colonnes et carrés, chaque groupe partitionnant la grille
+PARTITIONS = (UNIT_CELLS[:9], UNIT_CELLS[9:18], UNIT_CELLS[18:])
+
+BITS = 1 << np.arange(9)
+
+def candidates(puzzles):
+    """Tenseur (N, 81, 9) des possibilités initiales d'un tableau (N, 81)."""
+    puzzles = np.asarray(puzzles)
+    given = puzzles[:,:,None] == np.arange(1, 10)
+    return np.where((puzzles == 0)[:,:,None], True, given)
+
+def eliminate(cand):
+    """
+    Applique une passe d'élimination des singletons nus puis cachés à un
+    tenseur (n, 81, 9) de possibilités, modifié en place.
+    """
+    n = len(cand)
+
+    # singletons nus: un chiffre placé dans une autre case d'une unité est
+    # retiré des possibilités
+    placed = cand & (cand.sum(axis=2, dtype=np.int8) == 1)[:,:,None]
+    counts = placed[:,UNIT_CELLS].sum(axis=2, dtype=np.int8)
+    others = counts[:,CELL_UNITS] - placed[:,:,None,:]
+    cand &= ~(others > 0).any(axis=2)
+
+    # singletons cachés: un chiffre qui n'a plus qu'une position dans une
+    # unité y est placé
+    forced = np.zeros_like(cand)
+    for cells in PARTITIONS:
+        units = cand[:,cells]
+        hidden = units & (units.sum(axis=2, dtype=np.int8) == 1)[:,:,None,:]
+        forced[:,cells.ravel()] |= hidden.reshape((n, 81, 9))
+    cand[:] = np.where(forced.any(axis=2)[:,:,None], forced & cand, cand)
+
+def solve_many(puzzles):
+    """
+    Résout un tableau (N, 81) de grilles.
+
+    Retourne un tableau (N, 81) uint8 des solutions, dont les lignes sont
+    nulles pour les grilles sans solution, et le tableau booléen (N,) des
+    grilles résolues.
+    """
+    cand = candidates(puzzles)
+
+    # propage jusqu'à ce que plus aucune grille active ne change
+    active = np.arange(len(cand))
+    while len(active):
+        before = cand[active]
+        after = before.copy()
+        eliminate(after)
+        cand[active] = after
+        changed = (after != before).any(axis=(1, 2))
+        active = active[changed]
+
+    counts = cand.sum(axis=2)
+    solved = (counts == 1).all(axis=1)
+    solutions = np.where(solved[:,None], cand.argmax(axis=2) + 1, 0).astype(np.uint8)
+
+    # recherche grille par grille pour les autres, à partir des possibilités
+    # déjà réduites
+    for index in np.flatnonzero(~solved & (counts > 0).all(axis=1)):
+        masks = (cand[index] * BITS).sum(axis=1).tolist()
+        if solve(masks)[0]:
+            solutions[index] = [DIGITS[mask][0] for mask in masks]
+            solved[index] = True
+
+    return solutions, solved
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+Représentation compacte d'une grille de Sudoku sous forme de bitboard.
+
+La grille est conservée dans une chaîne de 81 octets (un chiffre par case, 0
+pour une case vide) accompagnée de 27 masques de 9 bits, un par ligne, colonne
+et carré. Le bit k - 1 d'un masque est levé si le chiffre k est encore
+disponible dans l'unité correspondante, de sorte que les possibilités d'une
+case s'obtiennent par un simple ET binaire des masques de ses unités.
+
+Une grille peut également être empaquetée à raison de 4 bits par case dans une
+chaîne de 41 octets, qui sert de clé dans les ensembles d'états explorés.
+
+Chaque état porte un hachage de Zobrist sur 64 bits, soit le OU exclusif d'une
+valeur aléatoire par couple (position, valeur de case). Une transition qui ne
+touche que quelques cases met le hachage à jour en conséquence, sans
+reparcourir la grille.
+"""
+
+from binascii import hexlify, unhexlify
+from random import Random
+from string import maketrans
+
+import numpy as np
+
+FULL = 0x1ff
+
+# indice du masque de ligne, de colonne et de carré de chaque position
+ROW = tuple(p // 9 for p in xrange(81))
+COLUMN = tuple(9 + p % 9 for p in xrange(81))
+SQUARE = tuple(18 + p // 27 * 3 + p % 9 // 3 for p in xrange(81))
+
+# nombre de possibilités et chiffres correspondants à chaque masque
+POPCOUNT = tuple(bin(mask).count('1') for mask in xrange(512))
+DIGITS = tuple(tuple(k for k in xrange(1, 10) if mask >> (k - 1) & 1)
+               for mask in xrange(512))
+
+# valeurs aléatoires de Zobrist pour chaque position et chaque valeur de case
+# (chiffre ou masque de possibilités), réduites à des entiers signés de 64 bits
+_random = Random(81)
+ZOBRIST = tuple(tuple(int(_random.getrandbits(64) - (1 << 63))
+                      for value in xrange(512))
+                for p in xrange(81))
+
+# conversion entre octets 0 à 9 et caractères '0' à '9'
+TO_CHARS = maketrans(''.join(map(chr, xrange(10))), '0123456789')
+FROM_CHARS = maketrans('0123456789', ''.join(map(chr, xrange(10))))
+
+class Grid(object):
+    """
+    État immuable et hachable d'une grille de Sudoku, conservé dans une chaîne
+    de 81 octets avec son hachage de Zobrist.
+
+    Se comporte comme une séquence de 81 entiers, ce qui le rend compatible
+    avec compact, numpify_state et les tests du type '0 not in state'.
+    """
+
+    __slots__ = ('cells', 'zobrist')
+
+    def __init__(self, cells, zobrist):
+        self.cells = cells
+        self.zobrist = zobrist
+
+    @classmethod
+    def from_state(cls, state):
+        """Construit une grille à partir d'une séquence de 81 entiers."""
+        cells = digits(state)
+        return cls(str(cells), zobrist(cells))
+
+    def blanks(self):
+        """Énumère les positions des cases vides."""
+        cells = self.cells
+        p = cells.find('\0')
+        while p >= 0:
+            yield p
+            p = cells.find('\0', p + 1)
+
+    def swap(self, p, q):
+        """
+        Calcule la grille résultante de la permutation des cases p et q en
+        mettant à jour le hachage pour ces deux cases seulement.
+        """
+        if p > q:
+            p, q = q, p
+        cells = self.cells
+        a, b = ord(cells[p]), ord(cells[q])
+        h = self.zobrist ^ ZOBRIST[p][a] ^ ZOBRIST[p][b] ^ ZOBRIST[q][b] ^ ZOBRIST[q][a]
+        cells = cells[:p] + cells[q] + cells[p + 1:q] + cells[p] + cells[q + 1:]
+        return Grid(cells, h)
+
+    def __len__(self):
+        return 81
+
+    def __getitem__(self, p):
+        return ord(self.cells[p])
+
+    def __iter__(self):
+        return iter(bytearray(self.cells))
+
+    def __contains__(self, k):
+        return chr(k) in self.cells
+
+    def __eq__(self, other):
+        return isinstance(other, Grid) and self.cells == other.cells
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.zobrist
+
+    def __array__(self, dtype=None):
+        return np.frombuffer(self.cells, dtype=np.uint8).astype(dtype or np.uint8)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, ''.join(map(str, self)))
+
+class Bitboard(Grid):
+    """
+    Grille accompagnée des masques des chiffres disponibles dans chaque unité.
+    """
+
+    __slots__ = ('masks',)
+
+    def __init__(self, cells, zobrist, masks):
+        Grid.__init__(self, cells, zobrist)
+        self.masks = masks
+
+    @classmethod
+    def from_state(cls, state):
+        """Construit un bitboard à partir d'une séquence de 81 entiers."""
+        cells = digits(state)
+        masks = [FULL] * 27
+        for p, k in enumerate(cells):
+            if k:
+                bit = ~(1 << (k - 1))
+                masks[ROW[p]] &= bit
+                masks[COLUMN[p]] &= bit
+                masks[SQUARE[p]] &= bit
+        return cls(str(cells), zobrist(cells), tuple(masks))
+
+    def candidates(self, p):
+        """Masque des chiffres possibles pour la position p."""
+        masks = self.masks
+        return masks[ROW[p]] & masks[COLUMN[p]] & masks[SQUARE[p]]
+
+    def possibilities(self):
+        """Somme des possibilités sur l'ensemble des cases vides."""
+        return sum(POPCOUNT[self.candidates(p)] for p in self.blanks())
+
+    def assign(self, p, k):
+        """
+        Calcule le bitboard résultant de l'assignation du chiffre k à la
+        position p en mettant à jour uniquement les trois masques touchés et le
+        hachage de la case.
+        """
+        masks = list(self.masks)
+        bit = ~(1 << (k - 1))
+        masks[ROW[p]] &= bit
+        masks[COLUMN[p]] &= bit
+        masks[SQUARE[p]] &= bit
+        cells = self.cells
+        h = self.zobrist ^ ZOBRIST[p][ord(cells[p])] ^ ZOBRIST[p][k]
+        return Bitboard(cells[:p] + chr(k) + cells[p + 1:], h, tuple(masks))
+
+class HashedTuple(tuple):
+    """
+    Tuple portant son hachage de Zobrist, pour les états dont les cases ne
+    tiennent pas sur un octet (par exemple des ensembles de possibilités).
+    """
+
+    def __new__(cls, cells, zobrist):
+        self = tuple.__new__(cls, cells)
+        self.zobrist = zobrist
+        return self
+
+    def __hash__(self):
+        return self.zobrist
+
+def digits(state):
+    """Octets des 81 cases d'un état, tableau NumPy ou séquence d'entiers."""
+    if isinstance(state, np.ndarray):
+        return bytearray(state.astype(np.uint8).tobytes())
+    return bytearray(map(int, state))
+
+def bitboard(state):
+    """Retourne l'état sous forme de bitboard, en le convertissant au besoin."""
+    if isinstance(state, Bitboard):
+        return state
+    return Bitboard.from_state(state)
+
+def grid(state):
+    """Retourne l'état sous forme de grille, en le convertissant au besoin."""
+    if isinstance(state, Grid):
+        return state
+    return Grid.from_state(state)
+
+def pack(state):
+    """
+    Empaquette un état (grille, séquence de 81 entiers ou forme compacte) à
+    raison de 4 bits par case dans une chaîne de 41 octets.
+
+    Chaque case correspond à un chiffre hexadécimal, ce qui permet de déléguer
+    la conversion à binascii.
+    """
+    if isinstance(state, Grid):
+        chars = state.cells.translate(TO_CHARS)
+    elif isinstance(state, basestring):
+        chars = state
+    else:
+        chars = str(bytearray(state)).translate(TO_CHARS)
+    return unhexlify(chars + '0')
+
+def unpack(packed):
+    """Retrouve le tuple de 81 entiers d'un état empaqueté par pack."""
+    return tuple(bytearray(hexlify(packed)[:81].translate(FROM_CHARS)))
+
+def unpack_compact(packed):
+    """Retrouve la forme compacte d'un état empaqueté par pack."""
+    return hexlify(packed)[:81]
+
+def zobrist(cells):
+    """
+    Calcule le hachage de Zobrist d'une séquence de 81 valeurs entières (au
+    plus 511) ou ensembles de possibilités.
+    """
+    h = 0
+    for p, value in enumerate(cells):
+        h ^= ZOBRIST[p][mask(value) if isinstance(value, frozenset) else value]
+    return h
+
+def mask(candidates):
+    """Masque de 9 bits correspondant à un ensemble de chiffres."""
+    return sum(1 << (k - 1) for k in candidates)
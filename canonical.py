@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""
+Forme canonique d'une grille sous les symétries du Sudoku et cache des
+solutions par classe d'équivalence.
+
+Deux grilles sont équivalentes si l'une s'obtient de l'autre en renommant les
+chiffres, en transposant la grille, en permutant les bandes (groupes de trois
+lignes) ou les piles (groupes de trois colonnes), ou en permutant les lignes
+d'une bande ou les colonnes d'une pile. Leurs solutions se correspondent par
+la même transformation.
+
+Le représentant canonique est la plus petite grille, dans l'ordre
+lexicographique, de la classe d'équivalence. Il est cherché en deux temps:
+
+ 1. le motif des cases données est minimisé ligne par ligne. Les 1296
+    permutations de colonnes sont évaluées d'un coup avec NumPy et seules les
+    permutations de lignes et de colonnes à égalité sont conservées, ce qui
+    évite d'énumérer les 3 359 232 transformations du groupe;
+ 2. parmi les transformations qui atteignent le motif minimal, les chiffres
+    sont renommés dans l'ordre de leur première apparition et la plus petite
+    grille est retenue.
+"""
+
+from collections import OrderedDict
+from itertools import permutations, product
+import os
+
+import numpy as np
+
+from aima.search import Node
+
+from aima.search import Node
+
+from bitboard import Grid, HashedTuple, pack, unpack, zobrist
+from propagation import CANDIDATES
+from utils import validate_state
+
+# permutations des colonnes qui préservent les piles: la colonne j de la grille
+# transformée est la colonne COLUMN_PERMUTATIONS[c][j] de la grille d'origine
+COLUMN_PERMUTATIONS = np.array([[3 * stack + column
+                                 for stack, order in zip(stacks, orders)
+                                 for column in order]
+                                for stacks in permutations(xrange(3))
+                                for orders in product(permutations(xrange(3)), repeat=3)])
+
+# poids de chaque colonne d'origine selon chaque permutation, la première
+# colonne transformée étant la plus significative: le motif d'une ligne de
+# cases données sous toutes les permutations s'obtient par un seul produit
+WEIGHTS = np.zeros((9, len(COLUMN_PERMUTATIONS)), dtype=int)
+WEIGHTS[COLUMN_PERMUTATIONS.T, np.arange(len(COLUMN_PERMUTATIONS))] = 1 << np.arange(8, -1, -1)[:,None]
+
+# nombre de transformations dont les chiffres sont renommés à la fois
+CHUNK = 4096
+
+# nombre maximal de transformations à égalité: au-delà, une grille presque
+# vide en compterait des millions et sa forme canonique coûterait des
+# secondes, bien plus que sa résolution. Les grilles de examples/ n'en
+# comptent jamais plus de 3888.
+MAX_TIED = 4 * CHUNK
+
+# forme canonique pas encore calculée, à distinguer de None (pas de forme)
+UNKNOWN = object()
+
+class Transform(object):
+    """
+    Transformation d'une grille vers sa forme canonique.
+
+    La case i de la forme canonique provient de la case positions[i] de la
+    grille d'origine, dont le chiffre k est renommé labels[k].
+    """
+
+    __slots__ = ('positions', 'labels')
+
+    def __init__(self, positions, labels):
+        self.positions = positions
+        self.labels = labels
+
+    def apply(self, state):
+        """Transforme une grille d'origine vers la forme canonique."""
+        return tuple(self.labels[np.asarray(state, dtype=np.uint8)[self.positions]])
+
+    def restore(self, state):
+        """Ramène une grille canonique, typiquement une solution, à l'origine."""
+        cells = np.zeros(81, dtype=np.uint8)
+        cells[self.positions] = np.argsort(self.labels)[np.asarray(state, dtype=np.uint8)]
+        return tuple(cells)
+
+def _pattern(grid):
+    """
+    Plus petits motifs de cases données de la grille 9x9 et transformations
+    qui les atteignent, sous forme de triplets (transposée, lignes,
+    permutations de colonnes), ou None si plus de MAX_TIED transformations
+    sont à égalité.
+    """
+    values = [np.dot(g != 0, WEIGHTS) for g in (grid, grid.T)]
+
+    frontier = [(t, (), np.arange(len(COLUMN_PERMUTATIONS))) for t in (0, 1)]
+    for step in xrange(9):
+        best, candidates = None, []
+        for t, rows, columns in frontier:
+            if step % 3 == 0:
+                bands = set(r // 3 for r in rows)
+                choices = [r for r in xrange(9) if r // 3 not in bands]
+            else:
+                band = rows[-1] // 3
+                choices = [r for r in xrange(3 * band, 3 * band + 3) if r not in rows]
+            for r in choices:
+                v = values[t][r][columns]
+                m = v.min()
+                if best is None or m < best:
+                    best, candidates = m, []
+                if m == best:
+                    candidates.append((t, rows + (r,), columns[v == m]))
+        if sum(len(columns) for t, rows, columns in candidates) > MAX_TIED:
+            return None
+        frontier = candidates
+    return frontier
+
+def _positions(frontier):
+    """Énumère par blocs les positions d'origine des transformations."""
+    chunk = []
+    for t, rows, columns in frontier:
+        rows = np.array(rows)
+        for start in xrange(0, len(columns), CHUNK):
+            cols = COLUMN_PERMUTATIONS[columns[start:start + CHUNK]]
+            if t:
+                positions = cols[:,None,:] * 9 + rows[None,:,None]
+            else:
+                positions = rows[None,:,None] * 9 + cols[:,None,:]
+            chunk.append(positions.reshape((-1, 81)))
+            if sum(map(len, chunk)) >= CHUNK:
+                yield np.concatenate(chunk)
+                chunk = []
+    if chunk:
+        yield np.concatenate(chunk)
+
+def canonical_form(state):
+    """
+    Calcule la forme canonique d'une grille de 81 chiffres.
+
+    Retourne la grille canonique sous forme compacte et la Transform qui y
+    mène, dont restore ramène une solution canonique à la grille d'origine.
+    Deux grilles équivalentes ont la même forme canonique.
+
+    Retourne None si la grille a trop de symétries, voir MAX_TIED.
+    """
+    cells = np.array(state, dtype=np.uint8).reshape(81)
+
+    frontier = _pattern(cells.reshape((9, 9)))
+    if frontier is None:
+        return None
+
+    best = None
+    for positions in _positions(frontier):
+        values = cells[positions]
+
+        # les chiffres sont renommés dans l'ordre de leur première apparition,
+        # les chiffres absents à la suite
+        seen = values[:,:,None] == np.arange(1, 10)
+        first = np.where(seen.any(axis=1), seen.argmax(axis=1), 81 + np.arange(9))
+        labels = np.zeros((len(values), 10), dtype=np.uint8)
+        labels[np.arange(len(values))[:,None], 1 + np.argsort(first, axis=1)] = np.arange(1, 10)
+        renamed = labels[np.arange(len(values))[:,None], values]
+
+        i = np.lexsort(renamed.T[::-1])[0]
+        if best is None or tuple(renamed[i]) < best[0]:
+            best = tuple(renamed[i]), positions[i], labels[i]
+
+    canonical, positions, labels = best
+    return ''.join(map(str, canonical)), Transform(positions, labels)
+
+def _givens(state):
+    """Chiffres d'un état, les ensembles de plusieurs possibilités valant 0."""
+    if isinstance(state[0], frozenset):
+        return [iter(k).next() if len(k) == 1 else 0 for k in state]
+    return list(state)
+
+def puzzle(problem):
+    """
+    Chiffres donnés de l'état initial d'un problème de Sudoku. Les cases
+    permutables d'un FilledSudoku et les cases à plusieurs possibilités d'un
+    NormalizedSudoku sont considérées vides.
+    """
+    cells = _givens(problem.initial)
+    for i, j in getattr(problem, 'initial_positions', ()):
+        cells[i * 9 + j] = 0
+    return tuple(cells)
+
+def solves(state, solution):
+    """Vérifie qu'une grille remplie est une solution valide de la grille state."""
+    return (len(solution) == 81 and 0 not in solution and
+            all(k == 0 or k == s for k, s in zip(state, solution)) and
+            validate_state(solution))
+
+class SolutionCache(object):
+    """
+    Cache LRU des solutions, indexé par la forme canonique des grilles.
+
+    Une grille et toutes ses grilles équivalentes partagent une seule entrée:
+    la solution de la forme canonique, ramenée à la grille demandée par la
+    transformation inverse. Les solutions des grilles récemment demandées
+    sont aussi conservées telles quelles, de sorte qu'une grille déjà vue
+    est retrouvée sans recalculer sa forme canonique.
+
+    Si un chemin est donné, les entrées y sont lues à la création du cache et
+    chaque nouvelle forme canonique y est ajoutée à raison d'une ligne par
+    couple (forme canonique, solution canonique). Une forme déjà écrite ne
+    l'est pas de nouveau, même après son éviction; les lignes en double
+    (écrites par des processus distincts) sont éliminées au chargement.
+
+    Une grille sans forme canonique (trop de symétries) n'est retrouvée que
+    telle quelle, parmi les grilles récemment demandées, et n'est pas écrite
+    sur le disque.
+    """
+
+    def __init__(self, capacity=4096, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        self.recent = OrderedDict()
+        self.hits = self.misses = 0
+        # formes canoniques présentes dans le fichier
+        self.stored = set()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        lines = OrderedDict()
+        count = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                canonical, solution = line.split()
+                lines.setdefault(canonical, solution)
+                count += 1
+        for canonical, solution in lines.iteritems():
+            self.stored.add(pack(canonical))
+            self._store(self.entries, pack(canonical), pack(solution))
+
+        # compacte le fichier s'il contient des doublons
+        if count > len(lines):
+            with open(self.path + '.tmp', 'w') as f:
+                for canonical, solution in lines.iteritems():
+                    f.write('%s %s\n' % (canonical, solution))
+            os.rename(self.path + '.tmp', self.path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, state):
+        if pack(state) in self.recent:
+            return True
+        form = canonical_form(state)
+        return form is not None and pack(form[0]) in self.entries
+
+    def _store(self, entries, key, value):
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+
+    def get(self, state):
+        """Solution de la grille state sous forme de tuple, ou None."""
+        return self.lookup(state)[0]
+
+    def lookup(self, state):
+        """
+        Solution de la grille state, ou None, et sa forme canonique telle que
+        retournée par canonical_form, à passer à put après un échec pour ne
+        pas la recalculer. La forme vaut UNKNOWN si elle n'a pas été calculée.
+        """
+        exact = pack(state)
+        value = self.recent.pop(exact, None)
+        if value is not None:
+            self.hits += 1
+            self.recent[exact] = value
+            return unpack(value), UNKNOWN
+
+        form = canonical_form(state)
+        if form is None:
+            self.misses += 1
+            return None, form
+        canonical, transform = form
+        key = pack(canonical)
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None, form
+        self.hits += 1
+        self.entries[key] = value
+        solution = transform.restore(unpack(value))
+        self._store(self.recent, exact, pack(solution))
+        return solution, form
+
+    def put(self, state, solution, form=UNKNOWN):
+        """
+        Mémorise la solution d'une grille. La forme canonique de la grille,
+        retournée par lookup, est calculée si elle n'est pas donnée.
+        """
+        if not solves(state, solution):
+            raise ValueError("la solution ne résout pas la grille")
+        self._store(self.recent, pack(state), pack(solution))
+        if form is UNKNOWN:
+            form = canonical_form(state)
+        if form is None:
+            return
+        canonical, transform = form
+        solution = transform.apply(solution)
+        key = pack(canonical)
+        self._store(self.entries, key, pack(solution))
+        if self.path is not None and key not in self.stored:
+            self.stored.add(key)
+            with open(self.path, 'a') as f:
+                f.write('%s %s\n' % (canonical, ''.join(map(str, solution))))
+
+def _like(initial, solution):
+    """Convertit une solution dans la représentation de l'état initial."""
+    if isinstance(initial, Grid):
+        return type(initial).from_state(solution)
+    if isinstance(initial, HashedTuple):
+        state = tuple(CANDIDATES[1 << (k - 1)] for k in solution)
+        return HashedTuple(state, zobrist(state))
+    return solution
+
+def cached(search, cache):
+    """
+    Enveloppe un algorithme de recherche pour consulter le cache avant de
+    lancer la recherche.
+
+    Sur un succès du cache, la solution est retournée avec 0 état exploré;
+    sinon, la recherche est lancée et sa solution, si elle résout la grille,
+    est mémorisée. Dans les deux cas, l'état final est retourné dans un Node,
+    comme le font les recherches dans un graphe, ou None.
+    """
+    def wrapper(problem, *argv, **kwargs):
+        state = puzzle(problem)
+        solution, form = cache.lookup(state)
+        if solution is not None:
+            return Node(_like(problem.initial, solution)), 0
+
+        result, explored = search(problem, *argv, **kwargs)
+        if result is not None and not isinstance(result, Node):
+            result = Node(result)
+        if result is not None:
+            cells = tuple(_givens(result.state))
+            if solves(state, cells):
+                cache.put(state, cells, form)
+        return result, explored
+
+    wrapper.__name__ = search.__name__
+    wrapper.__doc__ = search.__doc__
+    return wrapper
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Résolution du Sudoku comme un problème de couverture exacte par l'algorithme X
+de Knuth, implanté avec les liens dansants (Dancing Links).
+
+La matrice compte 729 lignes, une par triplet (case, chiffre), et 324 colonnes
+de contraintes: chaque case est remplie, et chaque chiffre apparaît une fois
+par ligne, par colonne et par carré. Une ligne de la matrice couvre donc
+exactement 4 colonnes.
+
+Les listes doublement chaînées sont représentées par des tableaux d'indices
+(L, R, U, D pour les voisins, C pour l'en-tête de colonne); le noeud 0 est la
+racine et les noeuds 1 à 324 sont les en-têtes de colonnes. La matrice vide
+est construite une seule fois et copiée pour chaque grille.
+"""
+
+from bitboard import bitboard
+
+COLUMNS = 324
+
+def _constraints(row):
+    """Indices des en-têtes des 4 colonnes couvertes par une ligne."""
+    p, d = divmod(row, 9)
+    i, j = divmod(p, 9)
+    return (1 + p,
+            1 + 81 + i * 9 + d,
+            1 + 162 + j * 9 + d,
+            1 + 243 + (i // 3 * 3 + j // 3) * 9 + d)
+
+def _matrix():
+    """Construit les tableaux de liens de la matrice de couverture complète."""
+    size = 1 + COLUMNS + 729 * 4
+    L, R, U, D, C = [0] * size, [0] * size, [0] * size, [0] * size, [0] * size
+    S = [0] * (COLUMNS + 1)
+
+    # en-têtes chaînés en cercle autour de la racine
+    for c in xrange(COLUMNS + 1):
+        L[c] = c - 1 if c else COLUMNS
+        R[c] = c + 1 if c < COLUMNS else 0
+        U[c] = D[c] = C[c] = c
+
+    node = COLUMNS + 1
+    for row in xrange(729):
+        first = node
+        for c in _constraints(row):
+            C[node] = c
+            U[node], D[node] = U[c], c
+            D[U[c]] = node
+            U[c] = node
+            S[c] += 1
+            L[node], R[node] = node - 1, node + 1
+            node += 1
+        L[first], R[node - 1] = node - 1, first
+
+    return L, R, U, D, C, S
+
+MATRIX = _matrix()
+
+def dancing_links_search(problem):
+    """
+    Résout la grille initiale d'un problème de Sudoku par couverture exacte.
+
+    Retourne la grille complétée (ou None si elle n'a pas de solution) et le
+    nombre de lignes essayées au cours de la recherche, soit l'équivalent du
+    nombre d'états explorés des autres algorithmes.
+    """
+    L, R, U, D, C, S = [list(links) for links in MATRIX]
+
+    def cover(c):
+        R[L[c]], L[R[c]] = R[c], L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                D[U[j]], U[D[j]] = D[j], U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(c):
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = L[R[c]] = c
+
+    # les chiffres donnés sont sélectionnés d'office
+    state = bitboard(problem.initial)
+    covered = set()
+    for p, k in enumerate(state):
+        if k:
+            row = p * 9 + k - 1
+            for c in _constraints(row):
+                if c in covered:
+                    return None, 0 # deux chiffres donnés en conflit
+                covered.add(c)
+                cover(c)
+
+    solution = []
+    explored = [0]
+
+    def search():
+        if R[0] == 0:
+            return True
+
+        # colonne la plus contrainte
+        c = best = R[0]
+        size = S[c]
+        while c and size > 1:
+            if S[c] < size:
+                best, size = c, S[c]
+            c = R[c]
+        if size == 0:
+            return False
+
+        cover(best)
+        r = D[best]
+        while r != best:
+            explored[0] += 1
+            solution.append(r)
+            j = R[r]
+            while j != r:
+                cover(C[j])
+                j = R[j]
+            if search():
+                return True
+            j = L[r]
+            while j != r:
+                uncover(C[j])
+                j = L[j]
+            solution.pop()
+            r = D[r]
+        uncover(best)
+        return False
+
+    if not search():
+        return None, explored[0]
+
+    cells = list(state)
+    for r in solution:
+        p, d = divmod((r - COLUMNS - 1) // 4, 9)
+        cells[p] = d + 1
+    return bitboard(cells), explored[0]
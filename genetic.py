@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Algorithme génétique vectorisé pour la formulation par permutations du
+Sudoku.
+
+La population est un tableau (P, 81) d'octets dont chaque individu est une
+grille remplie en respect des carrés, comme l'état initial d'un FilledSudoku.
+Les opérateurs préservent cette propriété, de sorte que seuls les conflits des
+lignes et des colonnes restent à éliminer:
+
+ - le croisement hérite chaque carré en entier de l'un ou l'autre parent;
+ - la mutation permute deux cases initialement vides d'un même carré;
+ - la sélection se fait par tournoi et les meilleurs individus (élites) sont
+   recopiés tels quels dans la génération suivante.
+
+Les conflits de toute la population sont évalués en un seul appel à
+count_conflicts.
+"""
+
+import numpy as np
+
+from bitboard import SQUARE, grid
+from utils import count_conflicts
+
+# carré de chaque position
+BOX = np.array(SQUARE) - 18
+
+def populate(puzzle, size, random):
+    """
+    Génère size grilles dont les cases vides de chaque carré reçoivent une
+    permutation aléatoire des chiffres manquants du carré.
+    """
+    puzzle = np.asarray(puzzle, dtype=np.uint8)
+    population = np.tile(puzzle, (size, 1))
+    for box in xrange(9):
+        cells = np.flatnonzero(BOX == box)
+        blanks = cells[puzzle[cells] == 0]
+        missing = np.setdiff1d(np.arange(1, 10), puzzle[cells]).astype(np.uint8)
+        order = np.argsort(random.rand(size, len(blanks)), axis=1)
+        population[:,blanks] = missing[order]
+    return population
+
+def genetic_algorithm(problem, population=1000, generations=1000, elites=50,
+                      tournament=3, pmut=0.5, seed=None, deadline=None):
+    """
+    Minimise les conflits d'un FilledSudoku par algorithme génétique.
+
+    La population compte population individus, dont elites sont recopiés
+    d'une génération à l'autre; les autres sont les enfants de parents
+    choisis par tournois de tournament individus, mutés avec une probabilité
+    pmut. La recherche s'arrête dès qu'une grille sans conflit apparaît ou
+    après generations générations, ou à l'échéance deadline (Deadline
+    d'aima.search), vérifiée à chaque génération.
+
+    Retourne la meilleure grille obtenue et le nombre d'individus évalués.
+    """
+    random = np.random.RandomState(seed)
+    if deadline: deadline.begin(problem)
+    puzzle = np.asarray(problem.puzzle, dtype=np.uint8)
+
+    # positions permutables de chaque carré qui en a au moins deux, complétées
+    # par des zéros, et leur nombre
+    boxes = problem.mutable_squares()
+    sizes = np.array(map(len, boxes))
+    mutable = np.zeros((len(boxes), 9), dtype=int)
+    for box, positions in enumerate(boxes):
+        mutable[box,:len(positions)] = positions
+
+    individuals = populate(puzzle, population, random)
+    fitness = count_conflicts(individuals)
+    evaluated = population
+
+    children = population - elites
+    for generation in xrange(generations):
+        order = np.argsort(fitness, kind='mergesort')
+        if fitness[order[0]] == 0 or not boxes:
+            break
+        if deadline and deadline.check(None, evaluated):
+            break
+
+        # tournois: le meilleur de tournament individus tirés au hasard
+        contenders = random.randint(population, size=(2, children, tournament))
+        winners = fitness[contenders].argmin(axis=2)
+        mothers, fathers = np.take_along_axis(contenders, winners[:,:,None], axis=2)[:,:,0]
+
+        # croisement carré par carré
+        inherit = random.rand(children, 9) < 0.5
+        offspring = np.where(inherit[:,BOX], individuals[mothers], individuals[fathers])
+
+        # mutation: permutation de deux cases d'un même carré
+        mutants = np.flatnonzero(random.rand(children) < pmut)
+        box = random.randint(len(boxes), size=len(mutants))
+        i = (random.rand(len(mutants)) * sizes[box]).astype(int)
+        j = (i + 1 + (random.rand(len(mutants)) * (sizes[box] - 1)).astype(int)) % sizes[box]
+        p, q = mutable[box, i], mutable[box, j]
+        offspring[mutants, p], offspring[mutants, q] = offspring[mutants, q], offspring[mutants, p]
+
+        individuals = np.concatenate((individuals[order[:elites]], offspring))
+        fitness = count_conflicts(individuals)
+        evaluated += population
+
+    return grid(individuals[fitness.argmin()]), evaluated
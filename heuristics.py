@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from utils import numpify_state, count_possibilities
+from bitboard import POPCOUNT, bitboard
+from utils import numpify_state, count_possibilities, stack_states, candidate_counts, count_conflicts
+
+# Chaque heuristique expose également une variante 'batch' qui évalue d'un coup
+# la liste des enfants produite par Node.expand, à partir d'un tableau (k, 81)
+# des états empilés. best_first_graph_search l'utilise lorsqu'elle existe.
+
+def stack(nodes):
+    """Empile les états d'une liste de noeuds dans un tableau (k, 81)."""
+    return stack_states(node.state for node in nodes)
 
 def possibilities(node):
     """Compte le nombre de choix possible."""
-    state = numpify_state(node.state)
-    possibilities = 0
-    for i, j in zip(*np.where(state == 0)):
-        line = state[i]
-        column = state[:,j]
-        square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-        possibilities += len(reduce(np.setdiff1d, [np.arange(1, 10), line, column, square.flatten()]))
-    return possibilities
+    return bitboard(node.state).possibilities()
+
+possibilities.batch = lambda nodes: candidate_counts(stack(nodes)).sum(axis=1).tolist()
 
 def most_constrained_cell(node):
     """
@@ -23,10 +27,23 @@ def most_constrained_cell(node):
     i, j, k = node.action
     return count_possibilities(node.parent.state, i, j)
 
+def _most_constrained_cell_batch(nodes):
+    # les enfants d'une même expansion partagent leur parent, dont les
+    # possibilités ne sont calculées qu'une fois
+    rows, parents = {}, []
+    for node in nodes:
+        if id(node.parent) not in rows:
+            rows[id(node.parent)] = len(parents)
+            parents.append(node.parent)
+    counts = candidate_counts(stack(parents))
+    return counts[[rows[id(node.parent)] for node in nodes],
+                  [node.action[0] * 9 + node.action[1] for node in nodes]].tolist()
+
+most_constrained_cell.batch = _most_constrained_cell_batch
+
 def remaining_blanks(node):
     """Heuristique basée sur le nombre de cases vides."""
-    state = numpify_state(node.state)
-    return state[state == 0].size
+    return bitboard(node.state).cells.count('\0')
     blanks = 3 * 729
     for i, j in zip(*np.where(state == 0)):
         line = state[i]
@@ -35,21 +52,17 @@ def remaining_blanks(node):
         blanks -= line[line == 0].size * column[column == 0].size * square[square == 0].flatten().size
     return blanks
 
+remaining_blanks.batch = lambda nodes: (stack(nodes) == 0).sum(axis=1).tolist()
+
 def non_inferable_cells(node):
     """
     Compte le nombre de cases qui ne peuvent pas être inférées, soit les cases
     qui ont plus d'une possibilité.
     """
-    state = numpify_state(node.state)
-    non_inferable = 0
-    for i, j in zip(*np.where(state == 0)):
-        line = state[i]
-        column = state[:,j]
-        square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-        possibilities = len(reduce(np.setdiff1d, [np.arange(1, 10), line, column, square.flatten()]))
-        if possibilities > 1:
-            non_inferable += 1
-    return non_inferable
+    state = bitboard(node.state)
+    return sum(1 for p in state.blanks() if POPCOUNT[state.candidates(p)] > 1)
+
+non_inferable_cells.batch = lambda nodes: (candidate_counts(stack(nodes)) > 1).sum(axis=1).tolist()
 
 def conflicts(node):
     """Heuristique qui compte le nombre de conflits dans une grille pour un
@@ -64,3 +77,4 @@ def conflicts(node):
             conflicts += line[line == value].size + column[column == value].size - 2
     return conflicts
 
+conflicts.batch = lambda nodes: count_conflicts(stack(nodes)).tolist()
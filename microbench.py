@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmarks des primitives des problèmes de Sudoku
+
+Chaque primitive (actions, résultat et valeur des problèmes, utilitaires et
+heuristiques) est exécutée sur le même échantillon de grilles, tiré de
+examples/ avec une graine fixe. Après warmup passes d'échauffement, chaque
+grille est chronométrée repeats fois sur number appels; la médiane, le 95e
+centile, la moyenne et le minimum du temps par appel sont calculés sur
+l'ensemble de ces mesures.
+
+Les résultats sont écrits en CSV dans la sortie standard et, avec --output,
+en JSON. Avec --baseline, ils sont comparés à un fichier JSON produit
+auparavant: une primitive dont la médiane dépasse celle de la référence de
+plus de --threshold (en proportion) est une régression, et le script termine
+alors avec le code 1. La référence results/microbench.json a été produite
+avec les options par défaut sur examples/100sudoku.txt.
+
+Les temps dépendent de la machine: comparés à cette référence, ceux d'une
+autre machine ne mesurent que l'écart entre les deux. Avant de comparer des
+changements, régénérer la référence localement à partir de l'état de départ
+(--output), puis comparer à ce fichier (--baseline) sur la même machine.
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from math import ceil
+from random import Random
+import csv
+import json
+import platform
+import sys
+
+import numpy as np
+
+from aima.search import Node
+from aima.utils import clock
+
+import heuristics
+from bitboard import FULL
+from propagation import CANDIDATES
+from sudoku import Sudoku, FilledSudoku
+from utils import load_examples, count_possibilities, normalize_state, validate_state
+
+FIELDNAMES = ('primitive', 'median', 'p95', 'mean', 'min', 'baseline', 'ratio', 'regression')
+
+HEURISTICS = ('possibilities', 'most_constrained_cell', 'remaining_blanks',
+              'non_inferable_cells')
+
+def sample(path, size, seed):
+    """Tire size grilles du fichier path avec la graine seed."""
+    examples = list(load_examples(path))
+    return Random(seed).sample(examples, min(size, len(examples)))
+
+def _sudoku(example):
+    problem = Sudoku(example)
+    child = Node(problem.initial).expand(problem)[0]
+    return problem, child
+
+def _heuristic(name, batch):
+    def prepare(example, seed):
+        f = getattr(heuristics, name)
+        problem, child = _sudoku(example)
+        if batch:
+            children = Node(child.state, child).expand(problem)
+            return lambda: f.batch(children)
+        return lambda: f(child)
+    return prepare
+
+def _conflicts(batch):
+    def prepare(example, seed):
+        # permutations simples: les super-branchements comptent des milliers
+        # d'enfants
+        problem = FilledSudoku(example, False, Random(seed))
+        node = Node(problem.initial)
+        if batch:
+            children = node.expand(problem)
+            return lambda: heuristics.conflicts.batch(children)
+        return lambda: heuristics.conflicts(node)
+    return prepare
+
+def _actions(example, seed):
+    problem, child = _sudoku(example)
+    return lambda: list(problem.actions(child.state))
+
+def _result(example, seed):
+    problem, child = _sudoku(example)
+    action = iter(problem.actions(child.state)).next()
+    return lambda: problem.result(child.state, action)
+
+def _value(example, seed):
+    problem, child = _sudoku(example)
+    return lambda: problem.value(child.state)
+
+def _count_possibilities(example, seed):
+    problem, child = _sudoku(example)
+    i, j = divmod(child.state.cells.index('\0'), 9)
+    return lambda: count_possibilities(child.state, i, j)
+
+def _validate_state(example, seed):
+    return lambda: validate_state(example)
+
+def _normalize_state(example, seed):
+    state = np.array([CANDIDATES[FULL if k == 0 else 1 << (k - 1)] for k in example],
+                     dtype=object)
+    return lambda: normalize_state(state)
+
+def _filled_value(example, seed):
+    problem = FilledSudoku(example, rng=Random(seed))
+    # chaque appel porte sur un nouvel état, comme au fil d'une recherche
+    states = [problem.result(problem.initial, problem.random_action(problem.initial))
+              for n in xrange(2)]
+    def run():
+        problem.value(states[0])
+        states.reverse()
+    return run
+
+# préparation de chaque primitive: appelée une fois par grille, hors du
+# chronométrage, elle retourne la fonction sans argument à chronométrer
+PRIMITIVES = OrderedDict([
+    ('Sudoku.actions', _actions),
+    ('Sudoku.result', _result),
+    ('Sudoku.value', _value),
+    ('count_possibilities', _count_possibilities),
+    ('validate_state', _validate_state),
+    ('normalize_state', _normalize_state),
+    ('FilledSudoku.value', _filled_value)]
+    + [(name, _heuristic(name, False)) for name in HEURISTICS]
+    + [('conflicts', _conflicts(False))]
+    + [(name + '.batch', _heuristic(name, True)) for name in HEURISTICS]
+    + [('conflicts.batch', _conflicts(True))])
+
+def percentile(samples, q):
+    """Centile q (entre 0 et 100) d'une liste triée, au rang le plus proche."""
+    return samples[max(int(ceil(q / 100.0 * len(samples))) - 1, 0)]
+
+def measure(runs, warmup=1, repeats=10, number=10):
+    """
+    Chronomètre une liste de fonctions sans argument, une par grille, et
+    retourne les statistiques du temps par appel en secondes.
+    """
+    for n in xrange(warmup):
+        for run in runs:
+            run()
+
+    samples = []
+    for r in xrange(repeats):
+        for run in runs:
+            start = clock()
+            for n in xrange(number):
+                run()
+            samples.append((clock() - start) / number)
+
+    samples.sort()
+    return {'median': percentile(samples, 50),
+            'p95': percentile(samples, 95),
+            'mean': sum(samples) / len(samples),
+            'min': samples[0],
+            'samples': len(samples)}
+
+def benchmark(examples, primitives=None, warmup=1, repeats=10, number=10, seed=0):
+    """
+    Mesure chaque primitive, toutes par défaut, sur une liste de grilles.
+    Retourne un dictionnaire ordonné des statistiques par primitive.
+    """
+    results = OrderedDict()
+    for name in primitives or PRIMITIVES:
+        runs = [PRIMITIVES[name](example, seed) for example in examples]
+        results[name] = measure(runs, warmup, repeats, number)
+    return results
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare des résultats à une référence de même format.
+
+    Retourne un dictionnaire des rapports des médianes par primitive et la
+    liste des primitives dont le rapport dépasse 1 + threshold. Les
+    primitives absentes de la référence sont ignorées.
+    """
+    ratios, regressions = {}, []
+    for name, stats in results.iteritems():
+        if name not in baseline:
+            continue
+        ratios[name] = stats['median'] / baseline[name]['median']
+        if ratios[name] > 1 + threshold:
+            regressions.append(name)
+    return ratios, regressions
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('examples', help='fichier de grilles, une par ligne')
+    parser.add_argument('--size', type=int, default=10,
+                        help="nombre de grilles de l'échantillon (%(default)s par défaut)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="graine de l'échantillon et des remplissages (%(default)s par défaut)")
+    parser.add_argument('--warmup', type=int, default=1,
+                        help="passes d'échauffement (%(default)s par défaut)")
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='mesures par grille (%(default)s par défaut)')
+    parser.add_argument('--number', type=int, default=10,
+                        help='appels par mesure (%(default)s par défaut)')
+    parser.add_argument('--primitive', action='append', choices=PRIMITIVES.keys(),
+                        help='primitive à mesurer, toutes par défaut (répétable)')
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    parser.add_argument('--baseline', help='fichier JSON des résultats de référence')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='hausse relative de la médiane tolérée (%(default)s par défaut)')
+    args = parser.parse_args()
+
+    examples = sample(args.examples, args.size, args.seed)
+    results = benchmark(examples, args.primitive, args.warmup, args.repeats,
+                        args.number, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(OrderedDict([('python', platform.python_version()),
+                                   ('numpy', np.__version__),
+                                   ('examples', args.examples), ('size', len(examples)),
+                                   ('seed', args.seed), ('warmup', args.warmup),
+                                   ('repeats', args.repeats), ('number', args.number),
+                                   ('results', results)]), f, indent=2)
+            f.write('\n')
+
+    baseline, ratios, regressions = {}, {}, []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        ratios, regressions = compare(results, baseline, args.threshold)
+
+    writer = csv.DictWriter(sys.stdout, fieldnames=FIELDNAMES, extrasaction='ignore')
+    writer.writeheader()
+    for name, stats in results.iteritems():
+        writer.writerow(dict(stats, primitive=name,
+                             baseline=baseline[name]['median'] if name in baseline else '',
+                             ratio=ratios.get(name, ''),
+                             regression='yes' if name in regressions else ''))
+
+    sys.exit(1 if regressions else 0)
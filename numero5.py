@@ -4,62 +4,377 @@
 Benchmarks
 
 Les résultats sont écrits en CSV dans la sortie standard.
+
+Chaque couple (grille, algorithme) est exécuté dans son propre processus, au
+plus --processes à la fois, et est interrompu s'il dépasse --timeout secondes
+de temps réel; une ligne dont 'explored' vaut 'timeout' est alors écrite,
+avec le temps réel écoulé dans 'wall' et 'time' vide. Les lignes sont écrites
+dans l'ordre des tâches, peu importe l'ordre dans lequel elles terminent.
+
+Avec --bloom, les recherches dans un graphe mémorisent les états explorés dans
+un filtre de Bloom de taille fixe; la colonne 'pruning' de leurs lignes vaut
+alors 'probabilistic', car un état peut avoir été écarté à tort, suivi du
+taux de remplissage du filtre, du taux estimé de faux positifs et du nombre
+d'états écartés, par exemple 'probabilistic fill=0.0123 fpr=1.5e-09
+pruned=42'.
+
+Avec --instrument, chaque problème est enveloppé dans un InstrumentedProblem
+et la colonne 'instrumentation' reçoit ses statistiques en JSON: temps par
+méthode et de l'heuristique, facteur de branchement par profondeur et tailles
+maximales de la frontière et de l'ensemble exploré.
+
+Avec --deadline, chaque recherche qui l'accepte reçoit une échéance de temps
+réel et retourne à son expiration le meilleur état rencontré; la colonne
+'deadline' vaut alors 'expired'. Contrairement à --timeout, la ligne garde un
+état final et son score.
+
+Chaque ligne rapporte aussi le temps réel ('wall_*') et le temps processeur
+('cpu_*') de la recherche: moyenne, écart type et minimum sur --repeats
+exécutions, les colonnes 'time' et 'wall' restant le temps processeur et le
+temps réel de la dernière. Les
+colonnes 'peak_frontier' et 'peak_explored' donnent les tailles maximales de
+la frontière et de l'ensemble exploré des recherches qui les rapportent, et
+'rss' la mémoire résidente maximale du processus en Kio. Avec --trace, une
+exécution supplémentaire sous tracemalloc (Python 3.4 et plus, ou le module
+pytracemalloc) donne dans 'traced' le pic d'allocations en octets. Les
+répétitions partagent le --timeout de leur tâche et les statistiques de
+--instrument les cumulent.
+
+Avec --cache, chaque recherche consulte d'abord un cache de solutions indexé
+par la forme canonique des grilles (voir canonical) et conservé dans le
+fichier donné; un succès retourne la solution avec 0 état exploré. Chaque
+tâche s'exécutant dans son propre processus, les solutions trouvées ne
+profitent qu'aux exécutions suivantes du script, par le fichier. --cache
+exclut --repeats, dont les répétitions retrouveraient la solution de la
+première exécution.
 """
 
-from contextlib import contextmanager
+from argparse import ArgumentParser
+from multiprocessing import Pipe, Process, cpu_count
+import copy
 import csv
+import inspect
+import resource
 import time
 import sys
 
-from aima.search import Node, depth_first_graph_search, hill_climbing, greedy_best_first_graph_search
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from aima.utils import BloomFilter, clock, mean, stddev
+from aima.search import Deadline, InstrumentedProblem, Node, depth_first_graph_search, first_choice_hill_climbing, hill_climbing, greedy_best_first_graph_search
 
+from annealing import simulated_annealing
+from backtracking import backtracking_search
+from dlx import dancing_links_search
+from genetic import genetic_algorithm
 from sudoku import Sudoku, FilledSudoku, NormalizedSudoku, RandomizedSudoku, SortedSudoku
+from tabu import tabu_search
+from bitboard import bitboard
+from canonical import SolutionCache, cached
 from heuristics import most_constrained_cell
 from utils import load_examples, compact
 
+FIELDNAMES = ('initial', 'algorithm', 'heuristic', 'bound', 'final', 'score','explored', 'time', 'wall', 'pruning', 'instrumentation', 'deadline',
+              'repeats', 'wall_mean', 'wall_stddev', 'wall_min',
+              'cpu_mean', 'cpu_stddev', 'cpu_min',
+              'traced', 'rss', 'peak_frontier', 'peak_explored')
+
+def describe(algorithm, problem, kwargs):
+    """Colonnes qui identifient une tâche."""
+    return {
+        'initial': compact(problem.initial),
+        'algorithm': algorithm.__name__,
+        'heuristic': kwargs['f'].__name__ if 'f' in kwargs else '',
+        'bound': kwargs['bound'] if 'bound' in kwargs else ''}
+
+class Peaks(object):
+    """
+    Crochet observe qui relève les tailles maximales de la frontière et de
+    l'ensemble exploré d'une recherche.
+    """
+
+    def __init__(self):
+        self.frontier = self.explored = None
 
-examples = load_examples(sys.argv[1])
-results = csv.DictWriter(sys.stdout, fieldnames=('initial', 'algorithm', 'heuristic', 'bound', 'final', 'score','explored', 'time'))
+    def __call__(self, frontier, explored):
+        self.frontier = max(self.frontier, len(frontier))
+        if explored is not None:
+            self.explored = max(self.explored, len(explored))
 
-results.writeheader()
+def pruning(explored):
+    """Colonne 'pruning': l'état d'un ensemble exploré probabiliste."""
+    if not getattr(explored, 'probabilistic', False):
+        return ''
+    return 'probabilistic fill=%.4g fpr=%.3g pruned=%d' % (
+        explored.fill_ratio(), explored.false_positive_rate(), explored.pruned)
 
 def bench(algorithm, problem, *argv, **kwargs):
-    """Benchmark an algorithm and write the results in the standard output."""
+    """Benchmark an algorithm and return the results as a CSV row."""
+    # un InstrumentedProblem relève lui-même les tailles maximales
+    peaks = None
+    if getattr(problem, 'observe', None) is None:
+        problem.observe = peaks = Peaks()
+
     # benchmark algorithm runtime
+    wall = clock()
     a = time.clock()
-    solution, explored = algorithm(problem, *argv, **kwargs)
-    delta = time.clock() - a
+    try:
+        solution, explored = algorithm(problem, *argv, **kwargs)
+    finally:
+        delta = time.clock() - a
+        wall = clock() - wall
+        if peaks is not None:
+            del problem.observe
+
+    # avant que le calcul du score ne s'ajoute aux statistiques
+    instrumentation = problem.json() if isinstance(problem, InstrumentedProblem) else ''
 
     if isinstance(solution, Node):
         solution = solution.state
 
-    # write results
-    results.writerow({
-        'initial': compact(problem.initial),
-        'algorithm': algorithm.__name__,
-        'heuristic': kwargs['f'].__name__ if 'f' in kwargs else '',
-        'bound': kwargs['bound'] if 'bound' in kwargs else '',
+    row = describe(algorithm, problem, kwargs)
+    row.update({
         'final': compact(solution) if solution else '',
         'score' : problem.value(solution) if solution else '',
         'explored': explored,
-        'time': delta})
+        'time': delta,
+        'pruning': pruning(kwargs.get('explored')),
+        'instrumentation': instrumentation,
+        'deadline': 'expired' if getattr(kwargs.get('deadline'), 'expired', False) else '',
+        'wall': wall,
+        'cpu': delta,
+        # 0 pour un InstrumentedProblem dont la recherche n'a rien rapporté
+        'peak_frontier': peaks.frontier if peaks else problem.peak_frontier or None,
+        'peak_explored': peaks.explored if peaks else problem.peak_explored or None})
+    return row
+
+def repeat(algorithm, problem, argv, kwargs, repeats=1, trace=False):
+    """
+    Exécute bench repeats fois, avec une copie fraîche des arguments
+    (filtre de Bloom, échéance, ...) à chaque fois, et retourne la ligne de la
+    dernière exécution complétée des statistiques des temps, de la mémoire
+    résidente maximale et, si trace est vrai, du pic d'allocations d'une
+    exécution supplémentaire sous tracemalloc.
+    """
+    walls, cpus = [], []
+    for n in xrange(repeats):
+        row = bench(algorithm, problem, *argv, **copy.deepcopy(kwargs))
+        walls.append(row['wall'])
+        cpus.append(row.pop('cpu'))
+
+    if trace:
+        tracemalloc.start()
+        try:
+            bench(algorithm, problem, *argv, **copy.deepcopy(kwargs))
+            row['traced'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    row.update({
+        'repeats': repeats,
+        'wall_mean': mean(walls),
+        'wall_stddev': stddev(walls) if repeats > 1 else 0.0,
+        'wall_min': min(walls),
+        'cpu_mean': mean(cpus),
+        'cpu_stddev': stddev(cpus) if repeats > 1 else 0.0,
+        'cpu_min': min(cpus),
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+    return row
+
+def tasks(examples, capacity=None, rate=1e-6):
+    """
+    Énumère les tâches (algorithme, problème, argv, kwargs) de chaque grille.
+
+    Si capacity est donné, chaque recherche dans un graphe reçoit son propre
+    filtre de Bloom de capacity états et de taux de faux positifs rate.
+    """
+    def explored():
+        return {'explored': BloomFilter(capacity, rate)} if capacity else {}
+
+    for example in examples:
+        sudoku = Sudoku(example)
+        randomized = RandomizedSudoku(example)
+        srt = SortedSudoku(example)
+        filled = FilledSudoku(example)
+        swaps = FilledSudoku(example, False)
+        normalized = NormalizedSudoku(example)
+
+        # couverture exacte, référence pour les autres algorithmes
+        yield dancing_links_search, sudoku, (), {}
+
+        # profondeur d'abord
+        yield depth_first_graph_search, sudoku, (), dict(explored(), bound=10000)
+
+        # Hill-Climbing
+        yield hill_climbing, filled, (), {}
+        yield first_choice_hill_climbing, filled, (), {'bound': 10000}
+
+        # recuit simulé et recherche tabou sur des permutations simples
+        yield simulated_annealing, swaps, (), {'seed': 0}
+        yield tabu_search, swaps, (), {'bound': 100000, 'seed': 0}
+        yield genetic_algorithm, swaps, (), {'seed': 0}
+
+        # recherche heuristique
+        yield greedy_best_first_graph_search, sudoku, (), dict(explored(), f=most_constrained_cell, bound=100)
+
+        # bonus
+        yield greedy_best_first_graph_search, normalized, (), dict(explored(), f=lambda node, normalized=normalized: normalized.value(node.state), bound=10000)
+        yield backtracking_search, normalized, (), {}
+
+def instrument(tasks):
+    """
+    Enveloppe le problème de chaque tâche dans un InstrumentedProblem, dont
+    l'heuristique éventuelle est chronométrée sous le nom 'heuristic'.
+    """
+    for algorithm, problem, argv, kwargs in tasks:
+        problem = InstrumentedProblem(problem)
+        if 'f' in kwargs:
+            kwargs = dict(kwargs, f=problem.timed(kwargs['f'], 'heuristic'))
+        yield algorithm, problem, argv, kwargs
+
+def filled(node):
+    """
+    Score d'une grille partielle à l'échéance: le nombre de cases remplies,
+    une impasse (une case vide sans possibilité) valant -1. La valeur d'un
+    Sudoku ne convient pas, car elle est maximale pour une impasse comme
+    pour une grille résolue.
+    """
+    state = bitboard(node.state)
+    blanks = list(state.blanks())
+    if any(state.candidates(p) == 0 for p in blanks):
+        return -1
+    return 81 - len(blanks)
+
+def limit(tasks, seconds):
+    """
+    Donne une échéance de seconds secondes à chaque tâche dont l'algorithme
+    accepte un argument deadline. L'horloge démarre avec la recherche.
+
+    Les grilles partielles d'un Sudoku sont départagées par filled; les
+    autres problèmes s'en remettent à l'objectif de la recherche ou à leur
+    valeur, voir Deadline.
+    """
+    for algorithm, problem, argv, kwargs in tasks:
+        if 'deadline' in inspect.getargspec(algorithm).args:
+            base = getattr(problem, 'problem', problem)
+            partial = isinstance(base, Sudoku) and not isinstance(base, FilledSudoku)
+            kwargs = dict(kwargs, deadline=Deadline(seconds, score=filled if partial else None))
+        yield algorithm, problem, argv, kwargs
+
+def memoize(tasks, cache):
+    """
+    Enveloppe l'algorithme de chaque tâche pour qu'il consulte le cache de
+    solutions cache avant de lancer la recherche, voir cached.
+    """
+    for algorithm, problem, argv, kwargs in tasks:
+        yield cached(algorithm, cache), problem, argv, kwargs
+
+def work(task, connection, repeats=1, trace=False):
+    """Exécute une tâche dans un processus enfant et en transmet la ligne."""
+    algorithm, problem, argv, kwargs = task
+    connection.send(repeat(algorithm, problem, argv, kwargs, repeats, trace))
+    connection.close()
+
+def run(tasks, processes, timeout, repeats=1, trace=False):
+    """
+    Exécute les tâches en parallèle et énumère leurs lignes dans l'ordre des
+    tâches.
+
+    Une tâche qui dépasse timeout secondes est tuée et remplacée par une ligne
+    de dépassement; une tâche dont le processus meurt sans résultat produit une
+    ligne dont 'explored' vaut 'error'. Ces lignes n'ont pas de temps
+    processeur: 'time' est vide et 'wall' reçoit le temps réel écoulé.
+    Chaque tâche est répétée repeats fois, voir repeat.
+    """
+    tasks = enumerate(tasks)
+    running = {}
+    rows = {}
+    written = 0
+    exhausted = False
+    while not exhausted or running:
+        # démarre de nouvelles tâches tant qu'il y a des processus libres
+        while not exhausted and len(running) < processes:
+            try:
+                index, task = next(tasks)
+            except StopIteration:
+                exhausted = True
+                break
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=work, args=(task, sender, repeats, trace))
+            process.daemon = True
+            process.start()
+            sender.close()
+            running[index] = (task, process, receiver, time.time())
+
+        idle = True
+        for index, (task, process, receiver, start) in running.items():
+            elapsed = time.time() - start
+            alive = process.is_alive()
+            if receiver.poll():
+                rows[index] = receiver.recv()
+            elif not alive:
+                rows[index] = dict(describe(task[0], task[1], task[3]), explored='error', time='', wall=elapsed)
+            elif elapsed > timeout:
+                process.terminate()
+                rows[index] = dict(describe(task[0], task[1], task[3]), explored='timeout', time='', wall=elapsed)
+            else:
+                continue
+            idle = False
+            process.join()
+            receiver.close()
+            del running[index]
 
-for example in examples:
-    sudoku = Sudoku(example)
-    randomized = RandomizedSudoku(example)
-    srt = SortedSudoku(example)
-    filled = FilledSudoku(example)
-    normalized = NormalizedSudoku(example)
+        while written in rows:
+            yield rows.pop(written)
+            written += 1
 
-    # profondeur d'abord
-    bench(depth_first_graph_search, sudoku, bound=10000)
+        if idle:
+            time.sleep(0.01)
 
-    # Hill-Climbing
-    bench(hill_climbing, filled)
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('examples', help='fichier de grilles, une par ligne')
+    parser.add_argument('--processes', type=int, default=cpu_count(),
+                        help='nombre de tâches exécutées simultanément (%(default)s par défaut)')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='temps réel alloué à chaque tâche en secondes (%(default)s par défaut)')
+    parser.add_argument('--bloom', type=int, metavar='CAPACITY',
+                        help="nombre d'états du filtre de Bloom des recherches dans un graphe")
+    parser.add_argument('--rate', type=float, default=1e-6,
+                        help='taux de faux positifs du filtre de Bloom (%(default)s par défaut)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='ajoute les statistiques de chaque problème en JSON')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='échéance des recherches, qui retournent alors leur meilleur état')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help="nombre d'exécutions de chaque tâche (%(default)s par défaut)")
+    parser.add_argument('--trace', action='store_true',
+                        help="mesure le pic d'allocations par une exécution sous tracemalloc")
+    parser.add_argument('--cache', metavar='PATH',
+                        help='fichier du cache des solutions consulté avant chaque recherche')
+    args = parser.parse_args()
+    if args.trace and tracemalloc is None:
+        parser.error('--trace requiert le module tracemalloc')
+    if args.repeats < 1:
+        parser.error('--repeats doit être au moins 1')
+    if args.cache and args.repeats > 1:
+        parser.error('--cache exclut --repeats')
 
-    # recherche heuristique
-    bench(greedy_best_first_graph_search, sudoku, f=most_constrained_cell, bound=100)
+    results = csv.DictWriter(sys.stdout, fieldnames=FIELDNAMES)
+    results.writeheader()
 
-    # bonus
-    bench(greedy_best_first_graph_search, normalized, f=lambda node: normalized.value(node.state), bound=10000)
+    queue = tasks(load_examples(args.examples), args.bloom, args.rate)
+    if args.instrument:
+        queue = instrument(queue)
+    if args.deadline is not None:
+        queue = limit(queue, args.deadline)
+    # après limit, qui inspecte les arguments de l'algorithme
+    if args.cache:
+        queue = memoize(queue, SolutionCache(path=args.cache))
 
+    for row in run(queue, args.processes, args.timeout, args.repeats, args.trace):
+        results.writerow(row)
+        sys.stdout.flush()
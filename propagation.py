@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Propagation de contraintes sur des masques de possibilités.
+
+Une grille est une liste de 81 masques de 9 bits, le bit k - 1 étant levé si le
+chiffre k est encore possible pour la case. Lorsqu'une case n'a plus qu'une
+possibilité, son chiffre est retiré de ses 20 cases paires; seules les cases
+modifiées sont remises dans la file de travail, au lieu de reparcourir toute
+la grille à chaque passe.
+"""
+
+from bitboard import COLUMN, FULL, POPCOUNT, ROW, SQUARE
+
+# cases partageant une ligne, une colonne ou un carré avec chaque position
+PEERS = tuple(tuple(q for q in xrange(81) if q != p and (ROW[q] == ROW[p] or
+                                                         COLUMN[q] == COLUMN[p] or
+                                                         SQUARE[q] == SQUARE[p]))
+              for p in xrange(81))
+
+# conversions entre masques et ensembles de possibilités
+CANDIDATES = tuple(frozenset(k for k in xrange(1, 10) if mask >> (k - 1) & 1)
+                   for mask in xrange(FULL + 1))
+MASKS = dict((candidates, mask) for mask, candidates in enumerate(CANDIDATES))
+
+def propagate(masks, queue, trail=None):
+    """
+    Propage les cases de la file queue, qui doivent n'avoir qu'une possibilité,
+    en modifiant masks en place.
+
+    Retourne la liste des positions réduites, ou None si une case se retrouve
+    sans possibilité. Dans ce cas, la propagation s'arrête aussitôt et la case
+    fautive conserve un masque nul.
+
+    Si une piste trail est donnée, l'ancien masque de chaque case réduite y est
+    ajouté sous forme d'un couple (position, masque), ce qui permet d'annuler
+    la propagation avec undo.
+    """
+    changed = []
+    while queue:
+        p = queue.pop()
+        bit = masks[p]
+        for q in PEERS[p]:
+            mask = masks[q]
+            if mask & bit:
+                if trail is not None:
+                    trail.append((q, mask))
+                mask &= ~bit
+                masks[q] = mask
+                if not mask:
+                    return None
+                changed.append(q)
+                if POPCOUNT[mask] == 1:
+                    queue.append(q)
+    return changed
+
+def undo(masks, trail, mark):
+    """Restaure les masques modifiés depuis que la piste avait la longueur mark."""
+    while len(trail) > mark:
+        p, mask = trail.pop()
+        masks[p] = mask
+
+def singletons(masks):
+    """Positions des cases qui n'ont qu'une possibilité."""
+    return [p for p, mask in enumerate(masks) if POPCOUNT[mask] == 1]
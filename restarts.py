@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Hill-Climbing à redémarrages aléatoires en parallèle sur un FilledSudoku.
+
+Chaque processus enchaîne des montées à partir d'un remplissage aléatoire des
+carrés, avec sa propre graine, et transmet le résultat de chaque montée. Dès
+qu'une montée atteint une grille sans conflit, ou que le budget de temps ou de
+redémarrages est épuisé, tous les processus sont interrompus.
+
+Les résultats sont écrits en CSV dans la sortie standard.
+"""
+
+from argparse import ArgumentParser
+from multiprocessing import Pipe, Process, Value, cpu_count
+from random import Random
+import csv
+import random
+import sys
+import time
+
+from aima.search import hill_climbing
+
+from bitboard import grid
+from sudoku import FilledSudoku
+from utils import load_examples, compact
+
+FIELDNAMES = ('initial', 'final', 'score', 'solved', 'restarts', 'moves', 'time')
+
+def climb(puzzle, super_branch, seed, claimed, restarts, connection):
+    """
+    Enchaîne des montées dans un processus enfant et transmet pour chacune un
+    triplet (cases, valeur, mouvements évalués).
+
+    Chaque montée réserve d'abord un redémarrage dans le compteur partagé
+    claimed, ce qui borne le nombre total de montées à restarts.
+    """
+    rng = Random(seed)
+    random.seed(seed) # bris d'égalité de hill_climbing
+    while True:
+        with claimed.get_lock():
+            if restarts is not None and claimed.value >= restarts:
+                break
+            claimed.value += 1
+        problem = FilledSudoku(puzzle, super_branch, rng)
+        state, moves = hill_climbing(problem)
+        connection.send((grid(state).cells, problem.value(state), moves))
+    connection.close()
+
+def random_restart_hill_climbing(puzzle, processes=None, timeout=60, restarts=None,
+                                 seed=None, super_branch=False):
+    """
+    Résout une grille par Hill-Climbing à redémarrages aléatoires répartis sur
+    processes processus (cpu_count() par défaut).
+
+    La recherche s'arrête à la première grille sans conflit, après timeout
+    secondes de temps réel ou après restarts montées; None lève la limite
+    correspondante.
+
+    Retourne la meilleure grille obtenue et un dictionnaire des statistiques
+    'solved', 'restarts', 'moves' et 'time'. Les montées interrompues ne sont
+    pas comptées.
+    """
+    processes = processes or cpu_count()
+    seeds = Random(seed)
+    claimed = Value('l', 0)
+
+    start = time.time()
+    running = []
+    for index in xrange(processes):
+        receiver, sender = Pipe(duplex=False)
+        process = Process(target=climb, args=(puzzle, super_branch, seeds.getrandbits(32),
+                                              claimed, restarts, sender))
+        process.daemon = True
+        process.start()
+        sender.close()
+        running.append((process, receiver))
+
+    best, score = None, None
+    stats = {'solved': False, 'restarts': 0, 'moves': 0}
+    while running and not stats['solved']:
+        if timeout is not None and time.time() - start > timeout:
+            break
+
+        idle = True
+        for process, receiver in list(running):
+            alive = process.is_alive()
+            while receiver.poll():
+                try:
+                    cells, value, moves = receiver.recv()
+                except EOFError:
+                    alive = False
+                    break
+                idle = False
+                stats['restarts'] += 1
+                stats['moves'] += moves
+                if score is None or value > score:
+                    best, score = cells, value
+                    stats['solved'] = value == 0
+            if not alive:
+                process.join()
+                receiver.close()
+                running.remove((process, receiver))
+
+        if idle:
+            time.sleep(0.01)
+
+    # interrompt les montées en cours
+    for process, receiver in running:
+        process.terminate()
+        process.join()
+        receiver.close()
+
+    stats['time'] = time.time() - start
+    return (grid(bytearray(best)) if best is not None else None), stats
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('examples', help='fichier de grilles, une par ligne')
+    parser.add_argument('--processes', type=int, default=cpu_count(),
+                        help='nombre de montées simultanées (%(default)s par défaut)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='temps réel alloué à chaque grille en secondes (%(default)s par défaut)')
+    parser.add_argument('--restarts', type=int,
+                        help='nombre maximal de montées par grille (illimité par défaut)')
+    parser.add_argument('--seed', type=int, help='graine des redémarrages')
+    parser.add_argument('--super-branch', action='store_true',
+                        help='utilise les actions de super-branchement')
+    args = parser.parse_args()
+
+    results = csv.DictWriter(sys.stdout, fieldnames=FIELDNAMES)
+    results.writeheader()
+
+    for example in load_examples(args.examples):
+        state, stats = random_restart_hill_climbing(example, args.processes, args.timeout,
+                                                    args.restarts, args.seed, args.super_branch)
+        row = dict(stats, initial=compact(example),
+                   final=compact(state) if state else '',
+                   score=FilledSudoku(example).value(state) if state else '')
+        results.writerow(row)
+        sys.stdout.flush()
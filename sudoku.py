@@ -4,20 +4,27 @@ __author__ = 'ntak'
 
 import numpy as np
 from itertools import combinations, product
-from random import shuffle
+from bisect import bisect
+from random import randrange, sample, shuffle
 
+from aima.utils import infinity
 from aima.search import Problem, depth_first_graph_search, hill_climbing, greedy_best_first_graph_search
 
-from utils import numpify_state, validate_state, count_possibilities, normalize_state, vlen
+from bitboard import COLUMN, DIGITS, FULL, ROW, ZOBRIST, Grid, HashedTuple, bitboard, grid, pack, zobrist
+from propagation import CANDIDATES, MASKS, propagate, singletons
+from utils import numpify_state, validate_state, count_possibilities
 
 class Sudoku(Problem):
     """
     Définition du probleme de Sudoku comme un problème de recherche dans
     l'espace d'états.
 
-    L'état, représenté par un tuple de 81 entiers, est supposé valide.
+    L'état, représenté par un bitboard de 81 cases, est supposé valide.
     """
 
+    def __init__(self, initial, goal=None):
+        Problem.__init__(self, bitboard(initial), goal)
+
     def actions(self, state):
         """
         les actions sont déterminées en retournant les possibilitiés qui
@@ -27,29 +34,22 @@ class Sudoku(Problem):
         La position de la case et la nouvelle valeur possible est retournée sous
         forme d'un triplet (i, j, k).
         """
-        state = numpify_state(state)
-        for i, j in zip(*np.where(state == 0)):
-            line = state[i]
-            column = state[:,j]
-            square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-            for k in xrange(1, 10):
-                # valide la nouvelle configuration et s'assurant qu'une même
-                # valeur non-nulle n'apparait pas plus d'une fois dans la ligne,
-                # colonne et carré correspondant
-                if k not in line and k not in column and k not in square:
-                    yield i, j, k
+        state = bitboard(state)
+        for p in state.blanks():
+            i, j = divmod(p, 9)
+            for k in DIGITS[state.candidates(p)]:
+                yield i, j, k
 
     def result(self, state, action):
         """
         Calcule la configuration résultante à appliquer une action sur une
         configuration.
 
-        Le nouvel état est une copie modifiée de l'état passé en argument.
+        Le nouvel état est une copie modifiée de l'état passé en argument dont
+        seuls les masques de la ligne, colonne et carré touchés sont mis à jour.
         """
         i, j, k = action
-        new_state = list(state)
-        new_state[i * 9 + j] = k
-        return tuple(new_state)
+        return bitboard(state).assign(i * 9 + j, k)
 
     def goal_test(self, state):
         """Vérifie si une grille est complète en supposant que l'état est valide"""
@@ -60,14 +60,14 @@ class Sudoku(Problem):
         The value of a state is determined by the sum of remaining possibilities
         for each cell in the grid.
         """
-        state = numpify_state(state)
-        possibilities = 729
-        for i, j in zip(*np.where(state == 0)):
-            line = state[i]
-            column = state[:,j]
-            square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-            possibilities -= len(reduce(np.setdiff1d, [np.arange(1, 10), line, column, square.flatten()]))
-        return possibilities
+        return 729 - bitboard(state).possibilities()
+
+    def key(self, state):
+        """
+        Les états explorés sont mémorisés sous forme empaquetée sur 41 octets
+        plutôt que par le bitboard complet.
+        """
+        return pack(state)
 
 class RandomizedSudoku(Sudoku):
     """Définition du problème de Sudoku avec branchement aléatoire."""
@@ -88,10 +88,21 @@ class FilledSudoku(Sudoku):
     """
     Définition du problème de Sudoku avec initialisation et actions basées sur
     des permutations.
+
+    Le problème tient le compte de chaque chiffre dans chaque ligne et colonne
+    du dernier état évalué, ce qui permet d'évaluer une permutation en temps
+    constant avec delta, sans construire l'état résultant.
     """
 
-    def __init__(self, initial, super_branch = True):
-        """Remplit la grille avec des valeurs qui respectent les carrés."""
+    def __init__(self, initial, super_branch = True, rng=None):
+        """
+        Remplit la grille avec des valeurs qui respectent les carrés.
+
+        Les cases vides reçoivent les chiffres manquants de leur carré dans
+        l'ordre croissant, ou dans un ordre aléatoire tiré de rng (une instance
+        de random.Random) s'il est donné.
+        """
+        self.puzzle = tuple(initial)
         state = numpify_state(initial)
 
         # préserve les positions initiales
@@ -101,73 +112,166 @@ class FilledSudoku(Sudoku):
         for i, j in zip(*np.where(state == 0)):
             square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
             possibilities = np.setdiff1d(np.arange(1, 10), square.flatten())
-            state.itemset((i, j), possibilities[0])
+            k = 0 if rng is None else rng.randrange(len(possibilities))
+            state.itemset((i, j), possibilities[k])
 
-        self.initial = tuple(state.flatten())
+        self.initial = Grid.from_state(state.flatten())
         self.super_branch = super_branch
 
+        # positions permutables (initialement vides) de chaque carré
+        self.mutable_positions = [[sorted(p for p in self.initial_positions if p[0] // 3 == i and p[1] // 3 == j)
+                                   for j in range(3)] for i in range(3)]
+
+        # groupes de carrés d'une action (un seul carré, ou trois carrés d'une
+        # bande, d'une pile ou d'une diagonale en super-branchement) et nombre
+        # cumulé d'actions, pour en tirer une au hasard sans les énumérer
+        groups = [[(i, j)] for i, j in product(range(3), range(3))]
+        if super_branch:
+            groups += [[(i, j) for j in range(3)] for i in range(3)]
+            groups += [[(j, i) for j in range(3)] for i in range(3)]
+            groups += [[(j, j) for j in range(3)], [(2 - j, j) for j in range(3)]]
+        self.groups, self.cumulated = [], []
+        total = 0
+        for group in groups:
+            count = 1
+            for i, j in group:
+                n = len(self.mutable_positions[i][j])
+                count *= n * (n - 1) // 2
+            if count:
+                total += count
+                self.groups.append(group)
+                self.cumulated.append(total)
+
+        self._counted = None
+
     def actions(self, state):
         """
         Énumère les permutations dans les carrés pour chaque position mutable.
+
+        Une action est une liste de permutations (x, y) de positions
+        initialement vides, chacune dans un carré distinct.
         """
-        if not self.super_branch:    
+        mutable_positions = self.mutable_positions
+
         # propose des permutations (x, y) carré par carré
-           for i, j in product(xrange(3), xrange(3)):
-            mutable_positions = set(product(range(i*3, i*3+3), range(j*3, j*3+3))) - set(self.initial_positions)
-            for swap in combinations(mutable_positions, 2):
-                yield swap
-        else :
+        for i, j in product(range(3), range(3)):
+            for swap in combinations(mutable_positions[i][j], 2):
+                yield [swap]
+
+        if not self.super_branch:
+            return
 
         #Super-branchement. Génère une enorme quantite de branchement. Mais augmente les chances de trouver un bon resultat.
-        #a tester. Faut modifier la fonction result() si ce morceaux la de code est utilisé
-            mutable_positions = [[None for i in range(3)] for j in range(3)]
-            for i, j in product(range(3), range(3)):
-                mutable_positions[i][j] = set(product(range(3*i, 3*i+3), range(3*j, 3*j+3))) - set(self.initial_positions)
-                for swap in combinations(mutable_positions[i][j], 2):
-                        yield [swap]
-                        
-            for i in range(3):
-
-                for x, ap in reduce(product,[combinations(mutable_positions[i][j], 2) for j in range(3)]):
-                    s, w = x
-                    yield s,w,ap
-                for x, ap in reduce(product,[combinations(mutable_positions[j][i], 2) for j in range(3)]):
-                    s,w = x
-                    yield s,w,ap
-
-            for x, ap in reduce(product,[combinations(mutable_positions[j][j], 2) for j in range(3)]):
-                s,w = x
-                yield s,w,ap
+        for i in range(3):
 
-            for x, ap in reduce(product,[combinations(mutable_positions[2-j][j], 2) for j in range(3)]):
+            for x, ap in reduce(product,[combinations(mutable_positions[i][j], 2) for j in range(3)]):
+                s, w = x
+                yield s,w,ap
+            for x, ap in reduce(product,[combinations(mutable_positions[j][i], 2) for j in range(3)]):
                 s,w = x
                 yield s,w,ap
 
+        for x, ap in reduce(product,[combinations(mutable_positions[j][j], 2) for j in range(3)]):
+            s,w = x
+            yield s,w,ap
 
+        for x, ap in reduce(product,[combinations(mutable_positions[2-j][j], 2) for j in range(3)]):
+            s,w = x
+            yield s,w,ap
 
-    def result(self, state, action):
-        """Effectue une permutation au sein d'un carré."""
- #       x, y = action
- #       state, new_state = tuple(map(numpify_state, [state]*2))
+    def mutable_squares(self):
+        """
+        Positions (0 à 80) des cases permutables de chaque carré qui en compte
+        au moins deux.
+        """
+        return [[i * 9 + j for i, j in positions]
+                for row in self.mutable_positions for positions in row
+                if len(positions) > 1]
 
+    def random_action(self, state):
+        """
+        Tire une action au hasard, uniformément parmi celles que retournerait
+        actions, sans les énumérer.
+        """
+        if not self.groups:
+            return None
+        group = self.groups[bisect(self.cumulated, randrange(self.cumulated[-1]))]
+        return [tuple(sample(self.mutable_positions[i][j], 2)) for i, j in group]
 
-        # permutate les deux positions (x, y)
-#        new_state.itemset(x, state[y])
-#        new_state.itemset(y, state[x])
+    def result(self, state, action):
+        """Effectue une permutation au sein d'un carré."""
+        # les permutations d'une action touchent des carrés distincts et le
+        # hachage n'est mis à jour que pour les cases permutées
+        state = grid(state)
+        for x,y in action:
+            state = state.swap(x[0] * 9 + x[1], y[0] * 9 + y[1])
 
-#        return tuple(new_state.flatten())
+        return state
 
-        #Si le super-branchement est utilisé, il faut utiliser ca comme fonction poru result() :
+    def counts(self, state):
+        """
+        Retourne le compte de chaque chiffre dans les 9 lignes puis les 9
+        colonnes d'un état, ainsi que son nombre de conflits.
 
-        state, new_state = tuple(map(numpify_state, [state]*2))
+        Les comptes du dernier état demandé sont conservés, de sorte que les
+        évaluations successives des voisins d'un même état ne les recalculent
+        pas.
+        """
+        state = grid(state)
+        if self._counted is not None and self._counted[0] == state:
+            return self._counted[1:]
 
-        for x,y in action:
-            new_state.itemset(x, state[y])
-            new_state.itemset(y, state[x])
+        counts = [[0] * 10 for unit in xrange(18)]
+        for p, k in enumerate(state):
+            counts[ROW[p]][k] += 1
+            counts[COLUMN[p]][k] += 1
+        conflicts = sum(c * (c - 1) for unit in counts for c in unit)
 
-        return tuple(new_state.flatten())
+        self._counted = state, counts, conflicts
+        return counts, conflicts
 
+    def delta(self, state, action):
+        """
+        Calcule la variation de valeur qu'entraînerait l'action, en temps
+        constant par permutation.
 
+        Retirer un chiffre a d'une unité et y ajouter un chiffre b fait varier
+        ses conflits de 2 * (c[b] - c[a] + 1). Les permutations d'une action
+        qui partagent des lignes ou des colonnes sont appliquées tour à tour
+        aux comptes, puis annulées.
+        """
+        counts, conflicts = self.counts(state)
+        cells = self._counted[0].cells
+
+        if len(action) == 1:
+            # une seule permutation: les comptes n'ont pas à être modifiés
+            (x, y), = action
+            p, q = x[0] * 9 + x[1], y[0] * 9 + y[1]
+            a, b = ord(cells[p]), ord(cells[q])
+            change = 0
+            if a != b:
+                for u, v in ((ROW[p], ROW[q]), (COLUMN[p], COLUMN[q])):
+                    if u != v:
+                        cu, cv = counts[u], counts[v]
+                        change += cu[b] - cu[a] + cv[a] - cv[b] + 2
+            return -2 * change
+
+        change = 0
+        moves = []
+        for x, y in action:
+            p, q = x[0] * 9 + x[1], y[0] * 9 + y[1]
+            a, b = ord(cells[p]), ord(cells[q])
+            if a == b:
+                continue
+            for u, v in ((ROW[p], ROW[q]), (COLUMN[p], COLUMN[q])):
+                if u != v:
+                    change += exchange(counts, u, v, a, b)
+                    moves.append((u, v, a, b))
+
+        for u, v, a, b in reversed(moves):
+            exchange(counts, u, v, b, a)
+
+        return -change
 
     def goal_test(self, state):
         """
@@ -176,35 +280,53 @@ class FilledSudoku(Sudoku):
 
         Seul les lignes et les colonnes sont vérifiées.
         """
-        state = numpify_state(state)
-        for line in state:
-            if np.bincount(line).max() > 1:
-                return False
-        for column in state.T:
-            if np.bincount(column).max() > 1:
-                return False
-        return True
+        return self.counts(state)[1] == 0
 
     def path_cost(self, c, state1, action, state2):
         return c + 1
 
     def value(self, state):
         """
-        La valeur d'un état est déterminé par le nombre de cases
-        non-conflictuelles, considérant qu'il n'y a pas de conflits sur les
-        carrés.
-        """
-        state = numpify_state(state)
-        conflicts = 0
-        for i in xrange(9):
-            for j in xrange(9):
-                if (i, j) not in self.initial_positions:
-                    value = state[i][j]
-                    line = state[i]
-                    column = state[:,j]
-                    conflicts += line[line == value].size + column[column == value].size - 2
-        # on cherche à minimiser les conflits (au plus 81 * 4 = 324)
-        return -1*conflicts
+        La valeur d'un état est l'opposé de son nombre de conflits, considérant
+        qu'il n'y a pas de conflits sur les carrés: chaque case compte les
+        autres cases de même valeur dans sa ligne et sa colonne.
+        """
+        # on cherche à minimiser les conflits (au plus 81 * 16 = 1296)
+        return -self.counts(state)[1]
+
+def exchange(counts, u, v, a, b):
+    """
+    Remplace un chiffre a par b dans l'unité u et b par a dans l'unité v, et
+    retourne la variation du nombre de conflits.
+    """
+    cu, cv = counts[u], counts[v]
+    change = 2 * (cu[b] - cu[a] + cv[a] - cv[b] + 2)
+    cu[a] -= 1
+    cu[b] += 1
+    cv[b] -= 1
+    cv[a] += 1
+    return change
+
+def swap_delta(cells, counts, p, q):
+    """
+    Variation du nombre de conflits qu'entraînerait la permutation des cases p
+    et q d'une grille modifiable (bytearray), sans la modifier.
+    """
+    a, b = cells[p], cells[q]
+    change = 0
+    for u, v in ((ROW[p], ROW[q]), (COLUMN[p], COLUMN[q])):
+        if u != v:
+            cu, cv = counts[u], counts[v]
+            change += cu[b] - cu[a] + cv[a] - cv[b] + 2
+    return 2 * change
+
+def apply_swap(cells, counts, p, q):
+    """Permute en place les cases p et q d'une grille modifiable et ses comptes."""
+    a, b = cells[p], cells[q]
+    for u, v in ((ROW[p], ROW[q]), (COLUMN[p], COLUMN[q])):
+        if u != v:
+            exchange(counts, u, v, a, b)
+    cells[p], cells[q] = b, a
 
 class NormalizedSudoku(Problem):
     """
@@ -219,12 +341,12 @@ class NormalizedSudoku(Problem):
     def __init__(self, initial):
         """ Remplit la grille avec des valeurs qui respectent les carrés."""
 
-        state = np.array([frozenset(range(1, 10) if k == 0 else [k])
-                          for k in initial]).reshape((9,9))
+        masks = [FULL if k == 0 else 1 << (k - 1) for k in initial]
+        propagate(masks, singletons(masks))
 
-        state = normalize_state(state)
+        state = tuple(CANDIDATES[mask] for mask in masks)
 
-        self.initial = tuple(state.flatten())
+        self.initial = HashedTuple(state, zobrist(state))
 
     def actions(self, state):
         """
@@ -234,30 +356,50 @@ class NormalizedSudoku(Problem):
 
         La position de la case et la nouvelle valeur possible est retournée sous
         forme d'un triplet (i, j, k).
+
+        Un état contradictoire, dont une case n'a plus aucune possibilité, est
+        une impasse et n'a pas d'actions.
         """
-        state = numpify_state(state)
+        if CANDIDATES[0] in state:
+            return
 
-        for i, j in zip(*np.where(vlen(state) > 1)):
-            for k in state[i, j]:
-                yield i, j, k
+        for p, candidates in enumerate(state):
+            if len(candidates) > 1:
+                i, j = divmod(p, 9)
+                for k in DIGITS[MASKS[candidates]]:
+                    yield i, j, k
 
     def result(self, state, action):
         """
         Calcule la configuration résultante à appliquer une action sur une
         configuration.
 
-        Le nouvel état est une copie modifiée de l'état passé en argument.
+        Le nouvel état est une copie modifiée de l'état passé en argument dont
+        seules les cases paires des cases réduites sont revisitées, et dont le
+        hachage n'est mis à jour que pour les cases réduites. La propagation
+        s'arrête dès qu'une contradiction est détectée.
         """
-        state = numpify_state(state)
+        h = getattr(state, 'zobrist', None)
+        if h is None:
+            h = zobrist(state)
+
+        previous = [MASKS[candidates] for candidates in state]
+        masks = list(previous)
 
         i, j, k = action
+        p = i * 9 + j
 
-        state.itemset((i, j), frozenset([k]))
+        masks[p] = 1 << (k - 1)
 
         # normalize
-        normalized_state = normalize_state(state)
+        changed = propagate(masks, [p])
+        if changed is None:
+            changed = [q for q in xrange(81) if masks[q] != previous[q]]
 
-        return tuple(normalized_state.flatten())
+        for q in set(changed + [p]):
+            h ^= ZOBRIST[q][previous[q]] ^ ZOBRIST[q][masks[q]]
+
+        return HashedTuple(tuple(CANDIDATES[mask] for mask in masks), h)
 
     def goal_test(self, state):
         """
@@ -271,6 +413,12 @@ class NormalizedSudoku(Problem):
         La valeur d'une grille est déterminée par la somme des possibilités de
         ses cases. 81 est soustrait, car une case sans possibilités contient au
         moins une valeur, soit l'unique possibilité.
+
+        Une impasse, dont une case n'a plus aucune possibilité, a une valeur
+        infinie: sinon, une recherche qui minimise la valeur la développerait
+        en premier.
         """
+        if CANDIDATES[0] in state:
+            return infinity
         return sum(map(len, state))
 
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recherche tabou dédiée au FilledSudoku.
+
+Le voisinage est celui des permutations de deux cases initialement vides d'un
+même carré. À chaque itération, la meilleure permutation non tabou est
+appliquée, même si elle augmente les conflits; une paire de cases permutée
+reste tabou pendant tenure itérations, sauf si la permutation mène à une
+grille meilleure que toutes celles rencontrées (critère d'aspiration).
+
+Seules les permutations qui touchent une case en conflit sont évaluées: les
+autres ne peuvent pas réduire les conflits. Chaque permutation est évaluée en
+temps constant à partir des comptes de chiffres par ligne et par colonne, qui
+sont mis à jour en place avec la grille.
+"""
+
+from random import Random
+
+from bitboard import COLUMN, ROW, grid
+from sudoku import apply_swap, swap_delta
+
+def tabu_search(problem, bound=100000, tenure=10, seed=None, deadline=None):
+    """
+    Minimise les conflits de l'état initial d'un FilledSudoku par recherche
+    tabou pendant au plus bound itérations, ou jusqu'à ce que l'échéance
+    deadline soit dépassée.
+
+    La mémoire est bornée par le nombre de paires de cases permutables.
+    Retourne la meilleure grille obtenue et le nombre d'itérations effectuées.
+    """
+    rng = Random(seed)
+    if deadline: deadline.begin(problem)
+    state = grid(problem.initial)
+    cells = bytearray(state.cells)
+    counts, conflicts = problem.counts(state)
+    counts = [list(unit) for unit in counts]
+
+    # paires de positions permutables de chaque carré
+    pairs = [(p, q) for square in problem.mutable_squares()
+             for n, p in enumerate(square) for q in square[n + 1:]]
+
+    best, best_cells = conflicts, str(cells)
+    tabu = {}
+
+    iteration = 0
+    while iteration < bound and best:
+        if deadline and deadline.check(None, iteration):
+            break
+        iteration += 1
+
+        conflicting = [counts[ROW[p]][k] > 1 or counts[COLUMN[p]][k] > 1
+                       for p, k in enumerate(cells)]
+
+        move, score, ties = None, None, 0
+        for p, q in pairs:
+            if not (conflicting[p] or conflicting[q]):
+                continue
+            change = swap_delta(cells, counts, p, q)
+            if tabu.get((p, q), 0) >= iteration and conflicts + change >= best:
+                continue
+            if score is None or change < score:
+                move, score, ties = (p, q), change, 1
+            elif change == score:
+                # bris d'égalité aléatoire
+                ties += 1
+                if rng.randrange(ties) == 0:
+                    move = p, q
+
+        if move is None:
+            # toutes les permutations sont tabou
+            tabu.clear()
+            continue
+
+        apply_swap(cells, counts, *move)
+        conflicts += score
+        tabu[move] = iteration + tenure
+
+        if conflicts < best:
+            best, best_cells = conflicts, str(cells)
+
+    return grid(bytearray(best_cells)), iteration
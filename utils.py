@@ -5,8 +5,12 @@ Utilitaires pour manipuler, valider et calculer sur un état d'une grille de
 Sudoku.
 """
 
-from itertools import product
+import os
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from bitboard import COLUMN, POPCOUNT, ROW, SQUARE, bitboard, grid
+from propagation import CANDIDATES, MASKS, propagate, singletons
 
 def compact(state):
     if isinstance(state[0], frozenset):
@@ -18,10 +22,94 @@ def load_examples(path):
         for line in f:
             yield tuple(map(int, line[:-1]))
 
+class Puzzles(object):
+    """
+    Grilles d'un fichier projeté en mémoire (memmap), une grille de 81 chiffres
+    par ligne.
+
+    Le fichier n'est lu qu'au fil des accès: l'indexation par un entier ou une
+    tranche retourne un tableau uint8 de forme (81,) ou (n, 81), converti en
+    une seule soustraction vectorisée. chunks permet de parcourir un fichier
+    plus grand que la mémoire par blocs de grilles.
+    """
+
+    def __init__(self, path):
+        # un fichier vide ne peut pas être projeté en mémoire
+        if os.path.getsize(path) < 81:
+            self.lines = np.zeros((0, 81), dtype=np.uint8)
+            return
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        # largeur d'une ligne, fin de ligne comprise ('\n' ou '\r\n')
+        width = 81
+        while width < len(data) and data[width] in (ord('\r'), ord('\n')):
+            width += 1
+        count = (len(data) - 81) // width + 1
+        self.lines = as_strided(data, shape=(count, 81), strides=(width, 1))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        puzzles = np.subtract(self.lines[index], ord('0'), dtype=np.uint8)
+        if (puzzles > 9).any():
+            raise ValueError('une grille contient autre chose que des chiffres')
+        return puzzles
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for puzzle in chunk:
+                yield puzzle
+
+    def chunks(self, size=65536):
+        """Énumère les grilles par tableaux (n, 81) d'au plus size grilles."""
+        for start in xrange(0, len(self), size):
+            yield self[start:start + size]
+
+def load_puzzles(path):
+    """Charge un fichier de grilles en bloc, voir Puzzles."""
+    return Puzzles(path)
+
 def numpify_state(state):
     """Génère une représentation facilement manipulable d'un état Sudoku."""
     return np.array(state).reshape((9,9))
 
+# positions des cases de chaque unité (lignes, colonnes puis carrés) et unités
+# de chaque case
+UNIT_CELLS = np.array([[p for p in xrange(81) if unit in (ROW[p], COLUMN[p], SQUARE[p])]
+                       for unit in xrange(27)])
+CELL_UNITS = np.array([ROW, COLUMN, SQUARE]).T
+
+def stack_states(states):
+    """Empile des états de 81 chiffres dans un tableau (k, 81) d'octets."""
+    cells = ''.join(grid(state).cells for state in states)
+    return np.frombuffer(cells, dtype=np.uint8).reshape((-1, 81))
+
+def candidate_counts(states):
+    """
+    Compte les possibilités de chaque case pour un tableau (k, 81) d'états en
+    une seule passe vectorisée. Les cases remplies ont 0 possibilité.
+    """
+    k = len(states)
+    present = np.zeros((k, 81, 10), dtype=bool)
+    present[np.arange(k)[:,None], np.arange(81), states] = True
+    used = present[:,UNIT_CELLS].any(axis=2)
+    used = used[:,CELL_UNITS].any(axis=2)
+    counts = 9 - used[:,:,1:].sum(axis=2)
+    counts[states != 0] = 0
+    return counts
+
+def count_conflicts(states):
+    """
+    Compte les conflits sur les lignes et les colonnes pour un tableau (k, 81)
+    de grilles remplies. Chaque case compte les autres cases de même valeur
+    dans sa ligne et sa colonne.
+    """
+    grids = states.reshape((-1, 9, 9))
+    present = grids[:,:,:,None] == np.arange(10)
+    lines = present.sum(axis=2)
+    columns = present.sum(axis=1)
+    return (lines ** 2).sum(axis=(1, 2)) + (columns ** 2).sum(axis=(1, 2)) - 162
+
 def validate_state(state):
     """Valide l'état d'une grille de Sudoku"""
     state = numpify_state(state)
@@ -42,14 +130,7 @@ def count_possibilities(state, i, j):
     Compte les possibilités dans une case donnée étant donné une représentation
     par ensembles de possibilités.
     """
-    state = numpify_state(state)
-    line = state[i]
-    column = state[:,j]
-    square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-    return len(reduce(np.setdiff1d, [np.arange(1, 10), line, column, square.flatten()]))
-
-vlen = np.vectorize(len)
-vpretty = np.vectorize(lambda x: list(x)[0] if len(x) == 1 else 0)
+    return POPCOUNT[bitboard(state).candidates(i * 9 + j)]
 
 def normalize_state(state):
     """
@@ -58,34 +139,12 @@ def normalize_state(state):
 
     'None' is returned if the normalization leads to an invalid state (due to a
     wrong hypothesis).
+
+    The sets are converted to 9-bit masks and reduced by propagate, which only
+    revisits the peers of the cells it changes.
     """
-    state = np.array(state) # mutate a copy
-    while True:
-        to_normalize = state[vlen(state) == 1].size # nombre de positions à réduire
-        for i, j in zip(*np.where(vlen(state) == 1)):
-            line = state[i]
-            column = state[:,j]
-            square = state[i//3*3:i//3*3+3,j//3*3:j//3*3+3]
-
-            value = state[i,j]
-
-            # reduce line
-            for line_j, item in enumerate(line):
-                if value < state[i,line_j]:
-                    state[i,line_j] = item - value
-
-            # reduce column
-            for column_i, item in enumerate(column):
-                if value < state[column_i,j]:
-                    state[column_i,j] = item - value
-
-            # reduce square
-            for square_position, item in zip(product(range(0,3), range(0,3)), square.flatten()):
-                x, y = i//3*3+square_position[0], j//3*3 + square_position[1]
-                if value < state[x,y]:
-                    state[x,y] = item - value
-
-        if state[vlen(state) == 1].size == to_normalize:
-            break # aucune réduction appliquée
-
-    return state
+    shape = np.shape(state)
+    masks = [MASKS[candidates] for candidates in np.asarray(state).flat]
+    if 0 in masks or propagate(masks, singletons(masks)) is None:
+        return None
+    return np.array([CANDIDATES[mask] for mask in masks], dtype=object).reshape(shape)